@@ -9,4 +9,5 @@ __all__ = [
     "alerts",
     "emailer",
     "run_monitor",
+    "fastjson",
 ]
@@ -14,14 +14,34 @@ ALERT_MIN_IMPACT = "Medium"
 # Ollama model identifier (MVP)
 OLLAMA_MODEL = "llama3:latest"
 
+# Max companies whose filing lists/documents are collected at once (1 = one at a time)
+MAX_CONCURRENT_COMPANIES = int(os.getenv("MAX_CONCURRENT_COMPANIES", "8"))
+# Max LLM batches (a single filing, or several short ones; see LLM_BATCH_SIZE)
+# analyzed and alerted on concurrently across all companies per poll
+MAX_CONCURRENT_FILINGS = int(os.getenv("MAX_CONCURRENT_FILINGS", "8"))
+
+# Cycles a filing is retried after an LLM timeout or a failed download/parse
+# before it is recorded as processed anyway. An unreachable Ollama server or a
+# network error doesn't count towards this; those are retried without limit
+MAX_FILING_ATTEMPTS = int(os.getenv("MAX_FILING_ATTEMPTS", "3"))
+
+# Short filings of the same form are sent to the LLM this many at a time in one
+# prompt; only texts up to LLM_BATCH_MAX_CHARS are batched (1 disables batching)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "4"))
+LLM_BATCH_MAX_CHARS = int(os.getenv("LLM_BATCH_MAX_CHARS", "2000"))
+
 # Max characters of filing text to feed the LLM
 MAX_FILING_CHARS = 15_000
 
 # Full Ollama HTTP API URL (can be overridden with env var OLLAMA_URL)
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/chat")
 
-# SQLite DB path (relative to project)
-DB_PATH = str(Path(__file__).parent / "db.sqlite")
+# Log verbosity, and an optional rotating log file (stderr when unset)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE")
+
+# SQLite DB path (relative to project; can be overridden with env var DB_PATH)
+DB_PATH = os.getenv("DB_PATH", str(Path(__file__).parent / "db.sqlite"))
 
 # SEC request headers (User-Agent required by SEC)
 SEC_HEADERS = {
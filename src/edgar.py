@@ -1,10 +1,100 @@
+import threading
+import time
 import requests
-import warnings
-from bs4 import BeautifulSoup, FeatureNotFound
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree, html as lxml_html
+from operator import itemgetter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from .config import SEC_HEADERS, MAX_FILING_CHARS
+from .fastjson import loads
+from .storage import get_storage
 
 SEC_SUBMISSIONS_URL = "https://data.sec.gov/submissions/CIK{cik}.json"
+_ARCH_PREFIX = "https://www.sec.gov/Archives/edgar/data/"
+
+# Forms we care about; everything else in the submissions list is dropped
+_WANTED_FORMS = frozenset({"8-K", "10-Q", "10-K", "4"})
+
+# Max in-flight document downloads
+MAX_CONCURRENT_FETCHES = 8
+# Process-wide cap on in-flight SEC requests, so companies collected in parallel
+# (each with its own download pool) still share one MAX_CONCURRENT_FETCHES budget
+_SEC_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_FETCHES)
+# SEC's fair-access limit. A concurrency cap alone doesn't enforce it (8 fast
+# responses in flight can mean far more than 10 req/s), so requests are also
+# spaced at least 1/SEC_MAX_REQUESTS_PER_SEC apart
+SEC_MAX_REQUESTS_PER_SEC = 10
+_RATE_LOCK = threading.Lock()
+_next_request_at = 0.0
+
+# The submissions list only changes when something is filed; reuse it for a few minutes
+FILINGS_CACHE_TTL = 300
+_FILINGS_CACHE: Dict[str, Tuple[float, List[dict]]] = {}
+
+# Stop downloading a filing after this many bytes; markup is stripped, so read
+# a few times MAX_FILING_CHARS to still end up with enough visible text
+MAX_FETCH_BYTES = 4 * MAX_FILING_CHARS
+
+# Bodies that yield less visible text than this (SEC block pages, parser
+# failures, or bodies too short to parse at all) are kept until fetch_document
+# asks for them, so saving a debug copy of the filing doesn't download it twice
+SHORT_TEXT_CHARS = 500
+_SHORT_BODIES: Dict[str, bytes] = {}
+
+# iXBRL filings are XHTML documents; recover from malformed markup instead of failing
+_XML_PARSER = etree.XMLParser(recover=True, huge_tree=True)
+
+# Visible text nodes under <body>, evaluated in C. local-name() keeps it working
+# for namespaced XHTML; whitespace-only nodes and script/style/noscript content are dropped.
+_TEXT_XPATH = etree.XPath(
+    "//*[local-name()='body']//text()"
+    "[normalize-space() and not(ancestor::*["
+    "local-name()='script' or local-name()='style' or local-name()='noscript'])]",
+    smart_strings=False,
+)
+# Fallback for documents without a <body>: every text node under the root,
+# with the same script/style/noscript content dropped
+_FALLBACK_TEXT_XPATH = etree.XPath(
+    "descendant::text()[not(ancestor::*["
+    "local-name()='script' or local-name()='style' or local-name()='noscript'])]",
+    smart_strings=False,
+)
+_UTF8_BOM = b"\xef\xbb\xbf"
+
+# Shared session so repeated SEC fetches reuse the same keep-alive TLS connection
+_SESSION = requests.Session()
+_SESSION.headers.update(SEC_HEADERS)
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+    ),
+)
+
+def _throttle():
+    """Block until another SEC request may start without exceeding SEC_MAX_REQUESTS_PER_SEC."""
+    global _next_request_at
+    with _RATE_LOCK:
+        now = time.monotonic()
+        wait = _next_request_at - now
+        _next_request_at = max(now, _next_request_at) + 1.0 / SEC_MAX_REQUESTS_PER_SEC
+    if wait > 0:
+        time.sleep(wait)
+
+def _normalize_cik(cik: str) -> Tuple[str, str]:
+    """Return (zero-padded, unpadded) forms of a CIK, validated once per call.
+
+    The submissions endpoint wants 10 digits; archive paths use the integer form.
+    """
+    try:
+        cik_int = str(int(cik))
+    except (TypeError, ValueError):
+        cik_int = str(cik)
+    return cik_int.zfill(10), cik_int
 
 def fetch_filings(cik: str) -> List[dict]:
     """
@@ -19,53 +109,175 @@ def fetch_filings(cik: str) -> List[dict]:
         "primary_doc_url": str
       }
     """
-    # The SEC submissions endpoint expects the CIK zero-padded to 10 digits
-    cik_padded = str(cik).zfill(10)
+    cik_padded, cik_int = _normalize_cik(cik)
+    cached = _FILINGS_CACHE.get(cik_padded)
+    if cached and time.time() - cached[0] < FILINGS_CACHE_TTL:
+        return list(cached[1])
+
     url = SEC_SUBMISSIONS_URL.format(cik=cik_padded)
-    r = requests.get(url, headers=SEC_HEADERS, timeout=20)
+    with _SEC_SLOTS:
+        _throttle()
+        r = _SESSION.get(url, timeout=20)
     r.raise_for_status()
-    data = r.json()
+    data = loads(r.content)
 
-    filings = []
     recent = data.get("filings", {}).get("recent", {})
     accession_list = recent.get("accessionNumber", [])
     form_list = recent.get("form", [])
     filing_dates = recent.get("filingDate", [])
     primary_docs = recent.get("primaryDocument", [])
 
-    for acc, form, fdate, pdoc in zip(accession_list, form_list, filing_dates, primary_docs):
-        # Build a best-effort primary doc URL. This matches typical EDGAR archive layout.
-        acc_no = acc.replace("-", "")
-        try:
-            cik_int = str(int(cik))
-        except Exception:
-            cik_int = cik
-        primary_doc_url = f"https://www.sec.gov/Archives/edgar/data/{cik_int}/{acc_no}/{pdoc}"
-        filings.append(
-            {
-                "accession_number": acc,
-                "form_type": form,
-                "filing_date": fdate,
-                "primary_doc": pdoc,
-                "primary_doc_url": primary_doc_url,
-            }
-        )
-
-    # Keep only forms we care about
-    wanted = {"8-K", "10-Q", "10-K", "4"}
-    filtered = [f for f in filings if f["form_type"] in wanted]
+    # Keep only forms we care about; reject before building anything per row.
+    # Build a best-effort primary doc URL. This matches typical EDGAR archive layout.
+    doc_prefix = "".join((_ARCH_PREFIX, cik_int, "/"))
+    filtered = [
+        {
+            "accession_number": acc,
+            "form_type": form,
+            "filing_date": fdate,
+            "primary_doc": pdoc,
+            "primary_doc_url": "".join((doc_prefix, acc.replace("-", ""), "/", pdoc)),
+        }
+        for acc, form, fdate, pdoc in zip(accession_list, form_list, filing_dates, primary_docs)
+        if form in _WANTED_FORMS
+    ]
 
     # Sort by filing_date descending
-    filtered.sort(key=lambda x: x.get("filing_date", ""), reverse=True)
-    return filtered
+    filtered.sort(key=itemgetter("filing_date"), reverse=True)
+    _FILINGS_CACHE[cik_padded] = (time.time(), filtered)
+    return list(filtered)
+
+def _join_text(pieces: Iterable[str], limit: int, separator: str = "\n") -> str:
+    """Join text nodes, stopping once `limit` characters have been collected."""
+    parts = []
+    size = 0
+    for piece in pieces:
+        parts.append(piece)
+        size += len(piece) + len(separator)
+        if size >= limit:
+            break
+    return separator.join(parts)[:limit]
 
-def extract_text(url: str) -> str:
-    r = requests.get(url, headers=SEC_HEADERS, timeout=20)
+def _accession_from_url(url: str) -> str:
+    # .../Archives/edgar/data/{cik}/{accession without dashes}/{primary doc}. The
+    # doc part is empty when EDGAR lists no primary document, so don't strip "/"
+    return url.split("/")[-2]
+
+def _cache_key(url: str, accession: Optional[str]) -> str:
+    # filings_cache rows use the dashless accession, as in the archive path
+    return accession.replace("-", "") if accession else _accession_from_url(url)
+
+def fetch_document(url: str) -> bytes:
+    """Download a filing document in full over the shared SEC session.
+
+    If `url` was just fetched by `extract_text(s)` and produced short text,
+    the body kept from that download (capped at MAX_FETCH_BYTES) is returned
+    instead of requesting it again.
+    """
+    body = _SHORT_BODIES.pop(url, None)
+    if body is not None:
+        return body
+    with _SEC_SLOTS:
+        _throttle()
+        r = _SESSION.get(url, timeout=20)
     r.raise_for_status()
-    try:
-        soup = BeautifulSoup(r.text, "xml")
-    except FeatureNotFound:
-        warnings.warn("xml parser not available; falling back to html.parser")
-        soup = BeautifulSoup(r.text, "html.parser")
-    text = soup.get_text(separator="\n")
-    return text[:MAX_FILING_CHARS]
+    return r.content
+
+def _download_text(url: str, min_bytes: int = 0) -> Optional[str]:
+    buf = bytearray()
+    with _SEC_SLOTS:
+        _throttle()
+        with _SESSION.get(url, timeout=20, stream=True) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=65536):
+                buf += chunk
+                if len(buf) >= MAX_FETCH_BYTES:
+                    break
+    body = bytes(buf)
+    if len(body) < min_bytes:
+        # Too short to pass the prefilter; skip the parse entirely
+        _SHORT_BODIES[url] = body
+        return None
+    text = document_text(body)
+    if len(text) < SHORT_TEXT_CHARS:
+        _SHORT_BODIES[url] = body
+    return text
+
+def document_text(body: bytes, limit: Optional[int] = MAX_FILING_CHARS) -> str:
+    """Extract the visible text of an HTML/XHTML/XML filing body with lxml."""
+    if body.startswith(_UTF8_BOM):
+        # Otherwise an XML declaration behind the BOM isn't recognized below
+        body = body[len(_UTF8_BOM):]
+    if not body.strip():
+        return ""
+    if body.lstrip().startswith(b"<?xml"):
+        root = etree.fromstring(body, parser=_XML_PARSER)
+    else:
+        root = lxml_html.fromstring(body)
+    if root is None:
+        return ""
+    pieces = _TEXT_XPATH(root)
+    if not pieces:
+        # Plain XML documents (e.g. ownership filings), and HTML fragments, have no <body>
+        pieces = _FALLBACK_TEXT_XPATH(root)
+    if limit is None:
+        return "\n".join(pieces)
+    return _join_text(pieces, limit)
+
+def extract_text(url: str, min_bytes: int = 0, accession: Optional[str] = None) -> Optional[str]:
+    """Return the visible text of a filing, served from the local cache when possible.
+
+    Filings are immutable once accepted by EDGAR, so cached text never needs
+    invalidating. The cache is keyed by `accession` (the filing's
+    accession_number) when given, else by the accession in the archive URL.
+    Returns None without parsing (or caching) when the body is shorter than
+    `min_bytes`; callers treat that as "skip".
+    """
+    accession = _cache_key(url, accession)
+    storage = get_storage()
+    cached = storage.get_filing_text(accession)
+    if cached is not None:
+        return cached
+    text = _download_text(url, min_bytes)
+    if text is not None:
+        storage.put_filing_text(accession, text)
+    return text
+
+def extract_texts(
+    urls: List[str],
+    max_workers: int = MAX_CONCURRENT_FETCHES,
+    min_bytes: Optional[List[int]] = None,
+    accessions: Optional[List[str]] = None,
+) -> List[Union[str, Exception, None]]:
+    """Fetch and extract several filings concurrently.
+
+    Results are returned in the same order as `urls`. A download or parse
+    failure does not abort the batch; the exception is returned in place of
+    that filing's text so the caller can skip it. Cache reads and writes stay
+    on the calling thread; only the downloads run in the pool. `min_bytes`
+    gives a per-url threshold and `accessions` the per-url cache keys, with the
+    same meaning as in `extract_text`.
+    """
+    min_bytes = min_bytes or [0] * len(urls)
+    keys = [_cache_key(url, acc) for url, acc in zip(urls, accessions or [None] * len(urls))]
+
+    def _safe_download(i: int) -> Union[str, Exception, None]:
+        try:
+            return _download_text(urls[i], min_bytes[i])
+        except Exception as e:
+            return e
+
+    storage = get_storage()
+    results: List[Union[str, Exception, None]] = [storage.get_filing_text(key) for key in keys]
+    missing = [i for i, text in enumerate(results) if text is None]
+    if len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as ex:
+            downloaded = list(ex.map(_safe_download, missing))
+    else:
+        downloaded = [_safe_download(i) for i in missing]
+    with storage.transaction():
+        for i, text in zip(missing, downloaded):
+            results[i] = text
+            if isinstance(text, str):
+                storage.put_filing_text(keys[i], text)
+    return results
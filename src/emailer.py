@@ -1,21 +1,75 @@
 import smtplib
+import threading
 from email.message import EmailMessage
-from typing import List
+from typing import List, Optional, Tuple
 from .config import SMTP
 
-def send_email(subject: str, body: str, to_addrs: List[str] | None = None):
+# Lazily opened, logged-in connection reused across alerts so the
+# STARTTLS + LOGIN handshake is paid once per run instead of once per mail
+_smtp_conn: Optional[smtplib.SMTP] = None
+_smtp_lock = threading.Lock()
+
+def _connect() -> smtplib.SMTP:
     cfg = SMTP
-    to_addrs = to_addrs or cfg.get("to_addrs", [])
+    server = smtplib.SMTP(cfg.get("host"), cfg.get("port", 587), timeout=30)
+    try:
+        server.starttls()
+        server.login(cfg.get("username"), cfg.get("password"))
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def _close_conn():
+    global _smtp_conn
+    if _smtp_conn is None:
+        return
+    try:
+        _smtp_conn.quit()
+    except Exception:
+        _smtp_conn.close()
+    _smtp_conn = None
+
+def _get_smtp() -> smtplib.SMTP:
+    """Return a live SMTP connection, reconnecting if the cached one went away."""
+    global _smtp_conn
+    if _smtp_conn is not None:
+        try:
+            if _smtp_conn.noop()[0] == 250:
+                return _smtp_conn
+        except (smtplib.SMTPException, OSError):
+            pass
+        _close_conn()
+    _smtp_conn = _connect()
+    return _smtp_conn
+
+def _build_message(subject: str, body: str, to_addrs: List[str]) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = cfg.get("from_addr")
+    msg["From"] = SMTP.get("from_addr")
     msg["To"] = ", ".join(to_addrs)
     msg.set_content(body)
+    return msg
 
-    server = smtplib.SMTP(cfg.get("host"), cfg.get("port", 587), timeout=30)
-    try:
-        server.starttls()
-        server.login(cfg.get("username"), cfg.get("password"))
-        server.send_message(msg)
-    finally:
-        server.quit()
+def send_emails(messages: List[Tuple[str, str]], to_addrs: List[str] | None = None):
+    """Send several (subject, body) messages over a single SMTP session."""
+    to_addrs = to_addrs or SMTP.get("to_addrs", [])
+    with _smtp_lock:
+        server = _get_smtp()
+        for subject, body in messages:
+            msg = _build_message(subject, body, to_addrs)
+            try:
+                server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # Server dropped an idle session between the liveness check and now
+                _close_conn()
+                server = _get_smtp()
+                server.send_message(msg)
+
+def send_email(subject: str, body: str, to_addrs: List[str] | None = None):
+    send_emails([(subject, body)], to_addrs)
+
+def close_smtp():
+    """Close the cached SMTP connection, if any."""
+    with _smtp_lock:
+        _close_conn()
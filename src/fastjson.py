@@ -0,0 +1,18 @@
+"""JSON encoding/decoding that uses orjson when it is installed and the stdlib otherwise."""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+if orjson is not None:
+    # Accepts bytes directly, so callers can skip decoding response bodies
+    loads = orjson.loads
+    # Returns compact UTF-8 bytes, ready to send as a request body
+    dumps = orjson.dumps
+else:
+    loads = json.loads
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -1,11 +1,25 @@
 import hashlib
+import re
 
 BOILERPLATE_PHRASES = [
     "forward-looking statements",
 ]
 
+# One case-insensitive pass over the text for all phrases, without a lowercased copy
+_BOILERPLATE_RE = (
+    re.compile("|".join(map(re.escape, BOILERPLATE_PHRASES)), re.IGNORECASE) if BOILERPLATE_PHRASES else None
+)
+
+def text_hash_bytes(data: bytes | bytearray | memoryview) -> str:
+    """Hash already-encoded content without another copy.
+
+    Dedup key only, not an integrity check. hashlib's SHA-256 is OpenSSL-backed
+    and uses SHA-NI where available, which outpaces BLAKE2 on those CPUs.
+    """
+    return hashlib.sha256(data, usedforsecurity=False).hexdigest()
+
 def text_hash(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return text_hash_bytes(text.encode("utf-8"))
 
 def prefilter(text: str, min_chars: int = 1500) -> bool:
     """Return True if text should be kept (passes filters).
@@ -18,8 +32,6 @@ def prefilter(text: str, min_chars: int = 1500) -> bool:
         return False
     if len(text) < min_chars:
         return False
-    lower = text.lower()
-    for p in BOILERPLATE_PHRASES:
-        if p in lower:
-            return False
+    if _BOILERPLATE_RE is not None and _BOILERPLATE_RE.search(text):
+        return False
     return True
@@ -2,225 +2,450 @@ import json
 import logging
 import os
 import re
+import threading
 import time
 import traceback
 import requests
-from requests.exceptions import RequestException
-from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+from typing import Dict, List, Optional
 from .config import OLLAMA_MODEL, OLLAMA_URL
+from .edgar import document_text
+from .fastjson import dumps, loads
+from .filters import text_hash
+from .storage import get_storage
 
 # Environment-configurable parameters
+OLLAMA_CONNECT_TIMEOUT = int(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+# Longest wait for the first streamed chunk. It has to cover loading the model
+# and evaluating the whole prompt, which on CPU regularly takes over 30s
+OLLAMA_STREAM_TIMEOUT = int(os.getenv("OLLAMA_STREAM_TIMEOUT", "120"))
+# Longest gap between streamed chunks once generation has started
 OLLAMA_CALL_TIMEOUT = int(os.getenv("OLLAMA_CALL_TIMEOUT", "30"))
 OLLAMA_CALL_RETRIES = int(os.getenv("OLLAMA_CALL_RETRIES", "3"))
-OLLAMA_STREAM_TIMEOUT = int(os.getenv("OLLAMA_STREAM_TIMEOUT", "120"))
+# Requests the Ollama server decodes at once; match the server's OLLAMA_NUM_PARALLEL.
+# Defaults to one sequence, since a request queued behind others on the server
+# spends its read timeout waiting there
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+# Wall-clock budget for a whole streamed response, first-chunk wait included
+OLLAMA_TOTAL_BUDGET = int(os.getenv("OLLAMA_TOTAL_BUDGET", "300"))
+# Context window sized for MAX_FILING_CHARS of filing text plus the system prompt
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
 DEBUG_DUMP_DIR = os.path.join(os.path.dirname(__file__), "debug_raw")
-os.makedirs(DEBUG_DUMP_DIR, exist_ok=True)
 
 # Setup logging for LLM module
 llm_logger = logging.getLogger(__name__)
-llm_logger.debug(f"LLM module initialized: OLLAMA_URL={OLLAMA_URL}, MODEL={OLLAMA_MODEL}")
-llm_logger.debug(f"Timeout settings: CALL={OLLAMA_CALL_TIMEOUT}s, STREAM={OLLAMA_STREAM_TIMEOUT}s, RETRIES={OLLAMA_CALL_RETRIES}")
+llm_logger.debug("LLM module initialized: OLLAMA_URL=%s, MODEL=%s", OLLAMA_URL, OLLAMA_MODEL)
+llm_logger.debug(
+    "Timeout settings: CONNECT=%ss, FIRST_CHUNK=%ss, CALL=%ss, BUDGET=%ss, RETRIES=%s",
+    OLLAMA_CONNECT_TIMEOUT, OLLAMA_STREAM_TIMEOUT, OLLAMA_CALL_TIMEOUT, OLLAMA_TOTAL_BUDGET, OLLAMA_CALL_RETRIES,
+)
+
+class OllamaUnavailableError(RuntimeError):
+    """Ollama couldn't be reached or is overloaded (failed connect, 502/503/504).
+
+    This says nothing about the filing itself, so callers should try it again
+    later instead of giving up on it.
+    """
+
+class OllamaTimeoutError(RuntimeError):
+    """Ollama accepted the request but didn't answer in time.
+
+    Unlike OllamaUnavailableError this can be down to the filing: a long prompt
+    on a slow host times out on every attempt, so retries should be limited.
+    """
+
+# Failures of the server rather than of the request; see OllamaUnavailableError
+_UNAVAILABLE_STATUSES = frozenset({502, 503, 504})
+
+def _read_timed_out(exc: Exception) -> bool:
+    # TimeoutError is the OLLAMA_TOTAL_BUDGET overrun raised while streaming
+    if isinstance(exc, (requests.ReadTimeout, TimeoutError)):
+        return True
+    # requests re-raises a read timeout in the middle of the body as ConnectionError
+    return isinstance(exc, requests.ConnectionError) and any(isinstance(arg, ReadTimeoutError) for arg in exc.args)
+
+def _server_unavailable(exc: Exception) -> bool:
+    # ConnectionError includes ConnectTimeout; RetryError is exhausted 5xx retries
+    if isinstance(exc, (requests.ConnectionError, requests.exceptions.RetryError)):
+        return True
+    response = getattr(exc, "response", None)
+    return isinstance(exc, requests.HTTPError) and response is not None and response.status_code in _UNAVAILABLE_STATUSES
+
+def _failure_type(exc: Exception) -> type:
+    if _read_timed_out(exc):
+        return OllamaTimeoutError
+    if _server_unavailable(exc):
+        return OllamaUnavailableError
+    return RuntimeError
+
+# Compiled once for _text_from_html_file instead of on every call
+_WS_RE = re.compile(r"\s+")
+
+# Pooled keep-alive session for every Ollama call; urllib3 handles retry backoff.
+# POSTs are only retried when the connection couldn't be made: re-sending a
+# prompt after a read timeout or 503 adds the same work to an already busy
+# server. Those filings are retried next cycle instead (see OllamaUnavailableError
+# and OllamaTimeoutError)
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=OLLAMA_CALL_RETRIES,
+        backoff_factor=1,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET"],
+    ),
+)
+_SESSION.mount("http://", _adapter)
+_SESSION.mount("https://", _adapter)
+# Request bodies are pre-encoded (see _encode_payload) rather than passed as json=
+_SESSION.headers["Content-Type"] = "application/json"
+# Sent with every request: a different num_ctx makes Ollama reload the model,
+# and a stable one lets it reuse the system prompt's KV prefix across filings
+_OLLAMA_OPTIONS = {"num_ctx": OLLAMA_NUM_CTX}
+# Filing workers outnumber the server's parallel sequences; extra requests wait
+# here instead of in Ollama's queue, where they would burn their first-token timeout
+_LLM_SLOTS = threading.BoundedSemaphore(OLLAMA_NUM_PARALLEL)
+
+# The system messages never change; build them once and share them across prompts
+_SCHEMA = (
+    "{\n  \"summary_bullets\": [string],\n  \"event_type\": string,"
+    "\n  \"impact_level\": string,\n  \"impact_reasoning\": string\n}\n"
+)
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You MUST respond with valid JSON only matching the schema:" + _SCHEMA,
+}
+_BATCH_SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "You MUST respond with valid JSON only: a JSON array with one object per "
+        "document, in the order given, each matching the schema:" + _SCHEMA
+    ),
+}
+
+# Part of every LLM cache key, so an answer is only reused for the prompt that
+# produced it: batch-context replies never stand in for single-filing analyses,
+# and changing a system prompt starts a fresh cache
+_PROMPT_TAG = text_hash(_SYSTEM_MSG["content"])[:16]
+_BATCH_PROMPT_TAG = text_hash(_BATCH_SYSTEM_MSG["content"])[:16]
 
 def build_prompt(text: str) -> list:
-    system = {
-        "role": "system",
-        "content": (
-            "You MUST respond with valid JSON only matching the schema:"
-            "{\n  \"summary_bullets\": [string],\n  \"event_type\": string,"
-            "\n  \"impact_level\": string,\n  \"impact_reasoning\": string\n}\n"
-        ),
-    }
-    user = {"role": "user", "content": text}
-    return [system, user]
-
-def analyze_filing(text: str, model: str = OLLAMA_MODEL, temperature: float = 0.25) -> Dict:
+    return [_SYSTEM_MSG, {"role": "user", "content": text}]
+
+def build_batch_prompt(texts: List[str]) -> list:
+    docs = "\n".join(f"---\nDOC {i}: {text}" for i, text in enumerate(texts, 1))
+    content = f"Return a JSON array, one object per document, in order:\n{docs}"
+    return [_BATCH_SYSTEM_MSG, {"role": "user", "content": content}]
+
+def _encode_payload(model: str, temperature: float, messages_json: bytes, stream: bool) -> bytes:
+    """Build an Ollama chat request body around already-encoded messages.
+
+    The messages, which carry the filing text, are serialized by the caller;
+    only the small fixed header is encoded here.
     """
-    Attempts to call a local Ollama API. This is a best-effort wrapper; in case the server
-    is not available the function will raise a RuntimeError with a helpful message.
+    # Ollama only honours sampling settings inside "options"; a top-level temperature is ignored
+    options = {**_OLLAMA_OPTIONS, "temperature": temperature}
+    head = dumps({"model": model, "options": options, "stream": stream})
+    return b"".join((head[:-1], b',"messages":', messages_json, b"}"))
+
+def _set_read_timeout(r: requests.Response, seconds: float):
+    """Change the socket read timeout of a streaming response that is already open."""
+    try:
+        r.raw._connection.sock.settimeout(seconds)
+    except AttributeError:
+        # Not a live urllib3 connection (already released, or a stand-in response)
+        pass
+
+def _ensure_debug_dir():
+    # Created on first dump rather than at import, so the happy path touches no disk
+    os.makedirs(DEBUG_DUMP_DIR, exist_ok=True)
+
+# Characters that can change scanner state; everything between them is skipped
+# by the regex engine in C instead of being stepped through one by one
+_STRING_SPECIAL_RE = re.compile(r'["\\]')
+_STRUCTURAL_RE = re.compile(r'[{}"]')
+_ARRAY_STRUCTURAL_RE = re.compile(r'[\[\]"]')
+
+class _JsonObjectScanner:
+    """Find the first balanced JSON object in text that arrives in pieces.
+
+    The brace depth / string / escape state is kept between `feed` calls, so
+    each streamed character is examined exactly once instead of rescanning
+    the whole accumulated response. With `array=True` it looks for the first
+    balanced JSON array instead.
     """
-    # First try a non-streaming request (prefer a complete response). Add
-    # a small retry loop and produce clearer logs on failures to help
-    # diagnose RemoteDisconnected / connection-abort situations.
-    payload = {
-        "model": model,
-        "messages": build_prompt(text),
-        "temperature": temperature,
-        "stream": False,
-    }
-    
-    llm_logger.debug(f"analyze_filing called with text_len={len(text)}, model={model}, timeout={OLLAMA_CALL_TIMEOUT}s")
-    print(f"[DEBUG] Connecting to Ollama: {OLLAMA_URL}")
-    print(f"[DEBUG] Model: {model}, Timeout: {OLLAMA_CALL_TIMEOUT}s, Retries: {OLLAMA_CALL_RETRIES}")
 
-    def _extract_content_from_payload(data) -> str:
-        if not isinstance(data, dict):
-            return None
-        # common structures observed from Ollama
-        if "choices" in data and data["choices"]:
-            return data["choices"][0].get("message", {}).get("content")
-        if "message" in data:
-            return data["message"].get("content")
-        return data.get("text")
-
-    def _extract_first_json_object(s: str) -> Optional[str]:
-        """Find the first balanced JSON object in a string and return it, or None."""
-        if not s:
-            return None
-        # Find first opening brace
-        start = s.find("{")
-        if start == -1:
+    def __init__(self, array: bool = False):
+        self._open, self._close = ("[", "]") if array else ("{", "}")
+        self._structural_re = _ARRAY_STRUCTURAL_RE if array else _STRUCTURAL_RE
+        self._parts = []
+        self._started = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._depth = 0
+
+    def feed(self, s: str) -> Optional[str]:
+        """Consume the next piece; return the object text once its closing brace arrives."""
+        if self._done or not s:
             return None
-        in_string = False
-        escape = False
-        depth = 0
-        for i in range(start, len(s)):
-            ch = s[i]
-            if ch == '"' and not escape:
-                in_string = not in_string
-            if ch == '\\' and not escape:
-                escape = True
-                continue
-            else:
-                escape = False
+        begin = 0
+        if not self._started:
+            begin = s.find(self._open)
+            if begin == -1:
+                return None
+            self._started = True
+        in_string, depth = self._in_string, self._depth
+        pos = begin
+        if self._escape:
+            # The previous piece ended on a backslash; this char is the escaped one
+            pos += 1
+            self._escape = False
+        n = len(s)
+        while pos < n:
             if in_string:
-                continue
-            if ch == '{':
-                depth += 1
-            elif ch == '}':
-                depth -= 1
-                if depth == 0:
-                    return s[start:i+1]
+                m = _STRING_SPECIAL_RE.search(s, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                if m.group() == '"':
+                    in_string = False
+                elif pos < n:
+                    pos += 1
+                else:
+                    self._escape = True
+            else:
+                m = self._structural_re.search(s, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                ch = m.group()
+                if ch == '"':
+                    in_string = True
+                elif ch == self._open:
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        self._done = True
+                        self._parts.append(s[begin:pos])
+                        return "".join(self._parts)
+        self._in_string, self._depth = in_string, depth
+        self._parts.append(s[begin:])
+        return None
+
+def _llm_cache_key(model: str, temperature: float, content_hash: str, prompt_tag: str = _PROMPT_TAG) -> str:
+    return text_hash(f"{model}|{temperature}|{prompt_tag}|{content_hash}")
+
+def _llm_cache_get(key: str) -> Optional[Dict]:
+    cached = get_storage().get_llm_response(key)
+    if cached is None:
         return None
-    
-    max_attempts = OLLAMA_CALL_RETRIES
-    for attempt in range(1, max_attempts + 1):
-        try:
-            print(f"[ATTEMPT {attempt}/{max_attempts}] POST to {OLLAMA_URL} (timeout={OLLAMA_CALL_TIMEOUT}s)...")
-            llm_logger.info(f"Non-streaming attempt {attempt}/{max_attempts} to {OLLAMA_URL}")
-            start = time.perf_counter()
-            r = requests.post(OLLAMA_URL, json=payload, timeout=OLLAMA_CALL_TIMEOUT)
-            elapsed = time.perf_counter() - start
-            logging.debug("Ollama non-streaming POST time: %.2fs", elapsed)
-            print(f"[RESPONSE] Status: {r.status_code}, Time: {elapsed:.2f}s")
-            # Log status for diagnostics
-            logging.debug("Ollama non-streaming POST status: %s", getattr(r, "status_code", None))
-            llm_logger.info(f"Ollama response: status={r.status_code}, elapsed={elapsed:.2f}s")
-            r.raise_for_status()
-            try:
-                data = r.json()
-            except Exception:
-                logging.debug("Ollama returned non-JSON body (first 1000 chars): %s", r.text[:1000])
-                llm_logger.error(f"Ollama returned non-JSON response: {r.text[:200]}")
-                print(f"[ERROR] Ollama returned non-JSON response")
-                # Dump raw response for postmortem
-                dump_path = os.path.join(DEBUG_DUMP_DIR, f"llm_nonjson_{int(time.time())}.txt")
-                try:
-                    with open(dump_path, "w", encoding="utf-8") as fh:
-                        fh.write(r.text)
-                    logging.debug("Wrote non-JSON Ollama response to %s", dump_path)
-                except Exception:
-                    logging.debug("Failed to write debug dump: %s", traceback.format_exc())
-                raise
-            content = _extract_content_from_payload(data)
-            if content:
-                try:
-                    return json.loads(content)
-                except Exception as e:
-                    raise RuntimeError(f"LLM returned non-JSON content: {content} (error: {e})")
-            # If no content was returned, break to streaming fallback
-            break
-        except RequestException as exc_nonstream:
-            logging.debug(
-                "Attempt %s/%s: non-streaming request failed: %s",
-                attempt,
-                max_attempts,
-                exc_nonstream,
-            )
-            llm_logger.warning(f"Non-streaming attempt {attempt} failed: {type(exc_nonstream).__name__}: {exc_nonstream}")
-            print(f"[ATTEMPT {attempt}] FAILED: {type(exc_nonstream).__name__}")
-            if attempt < max_attempts:
-                wait_time = 1 * attempt
-                llm_logger.info(f"Waiting {wait_time}s before retry...")
-                print(f"[RETRY] Waiting {wait_time}s before retry {attempt+1}/{max_attempts}...")
-                time.sleep(wait_time)
-                continue
-            logging.debug("Giving up non-streaming attempts, will try streaming fallback")
-            llm_logger.info("Non-streaming attempts exhausted, falling back to streaming mode")
-            print(f"[FALLBACK] Switching to streaming mode...")
-
-    # Streaming fallback: accumulate assistant chunks until done==true
     try:
-        payload_stream = {"model": model, "messages": build_prompt(text), "temperature": temperature}
-        print(f"[STREAMING] Connecting to {OLLAMA_URL} with timeout={OLLAMA_STREAM_TIMEOUT}s...")
-        llm_logger.info(f"Starting streaming request to {OLLAMA_URL}")
+        return loads(cached)
+    except Exception:
+        llm_logger.warning("Ignoring unreadable LLM cache entry %.12s", key)
+        return None
+
+def _llm_cache_put(key: str, model: str, result: Dict):
+    get_storage().put_llm_response(key, model, dumps(result).decode("utf-8"))
+
+def analyze_filing(
+    text: str,
+    model: str = OLLAMA_MODEL,
+    temperature: float = 0.25,
+    cache: bool = False,
+    content_hash: Optional[str] = None,
+) -> Dict:
+    """
+    Attempts to call a local Ollama API. This is a best-effort wrapper; in case the server
+    is not available the function will raise a RuntimeError with a helpful message
+    (an OllamaUnavailableError when it couldn't be reached, an OllamaTimeoutError
+    when it didn't answer in time).
+
+    Results are cached by (model, temperature, prompt, text) when
+    `temperature == 0` or `cache=True`, so repeated inputs skip the LLM call.
+    Pass `content_hash` (the `text_hash` of `text`) if the caller already
+    computed it.
+    """
+    if not (cache or temperature == 0):
+        return _request_analysis(build_prompt(text), model, temperature)
+
+    key = _llm_cache_key(model, temperature, content_hash or text_hash(text))
+    cached = _llm_cache_get(key)
+    if cached is not None:
+        llm_logger.info("LLM cache hit for %.12s; skipping Ollama call", key)
+        return cached
+    result = _request_analysis(build_prompt(text), model, temperature)
+    _llm_cache_put(key, model, result)
+    return result
+
+def analyze_filings_batch(
+    texts: List[str],
+    model: str = OLLAMA_MODEL,
+    temperature: float = 0.25,
+    cache: bool = False,
+    content_hashes: Optional[List[str]] = None,
+) -> List[Dict]:
+    """Analyze several short filings with a single Ollama call.
+
+    Returns one analysis per text, in order. Raises ValueError when the reply
+    is not a JSON array of one object per text sent, so callers can fall back
+    to `analyze_filing` per text. Caching works as in `analyze_filing` but
+    under the batch prompt, so batched and single analyses of the same text are
+    kept apart; only the texts without a cached batch analysis are sent.
+    """
+    if not (cache or temperature == 0):
+        return _request_batch(texts, model, temperature)
+
+    hashes = content_hashes or [text_hash(text) for text in texts]
+    keys = [_llm_cache_key(model, temperature, h, _BATCH_PROMPT_TAG) for h in hashes]
+    results: List[Optional[Dict]] = [_llm_cache_get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) < len(texts):
+        llm_logger.info("LLM cache hit for %d of %d batched filings", len(texts) - len(missing), len(texts))
+    if missing:
+        for i, result in zip(missing, _request_batch([texts[i] for i in missing], model, temperature)):
+            _llm_cache_put(keys[i], model, result)
+            results[i] = result
+    return results
+
+def _request_batch(texts: List[str], model: str, temperature: float) -> List[Dict]:
+    result = _request_analysis(build_batch_prompt(texts), model, temperature, array=True)
+    if not isinstance(result, list) or len(result) != len(texts) or not all(isinstance(a, dict) for a in result):
+        raise ValueError(f"Expected a JSON array of {len(texts)} analyses, got: {str(result)[:200]}")
+    return result
+
+def _request_analysis(messages: list, model: str, temperature: float, array: bool = False):
+    with _LLM_SLOTS:
+        return _stream_analysis(messages, model, temperature, array)
+
+def _stream_analysis(messages: list, model: str, temperature: float, array: bool):
+    # Always stream: OLLAMA_STREAM_TIMEOUT bounds the wait for the first chunk
+    # (model load plus prompt evaluation), OLLAMA_CALL_TIMEOUT every gap after
+    # it, OLLAMA_TOTAL_BUDGET the whole reply, and the scanner returns as soon
+    # as the JSON value closes, usually before the model has finished generating.
+    # Only failed connects are retried here; see the session's urllib3 Retry.
+    messages_json = dumps(messages)
+
+    llm_logger.debug(
+        "analyze_filing called with text_len=%d, model=%s, timeout=%ss",
+        len(messages[-1]["content"]), model, OLLAMA_STREAM_TIMEOUT,
+    )
+
+    try:
+        llm_logger.info("Starting streaming request to %s", OLLAMA_URL)
         start = time.perf_counter()
-        r = requests.post(OLLAMA_URL, json=payload_stream, stream=True, timeout=OLLAMA_STREAM_TIMEOUT)
+        r = _SESSION.post(
+            OLLAMA_URL,
+            data=_encode_payload(model, temperature, messages_json, True),
+            stream=True,
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_STREAM_TIMEOUT),
+        )
         elapsed = time.perf_counter() - start
-        logging.debug("Ollama streaming POST time: %.2fs", elapsed)
-        logging.debug("Ollama streaming POST status: %s", getattr(r, "status_code", None))
-        llm_logger.info(f"Streaming connection established: status={r.status_code}, elapsed={elapsed:.2f}s")
-        print(f"[STREAMING] Connected: status={r.status_code}, elapsed={elapsed:.2f}s")
-        
-        assembled = ""
+        llm_logger.info("Streaming connection established: status=%s, elapsed=%.2fs", r.status_code, elapsed)
+        deadline = start + OLLAMA_TOTAL_BUDGET
+
+        # Collect pieces and join once; `+=` on a growing str copies the whole buffer each time
+        parts = []
+        assembled_len = 0
         last_chunk = None
         chunk_count = 0
-        for line in r.iter_lines(decode_unicode=True):
-            if not line:
-                continue
-            # Each line should be a small JSON chunk; try to parse it, otherwise append raw
-            try:
-                chunk = json.loads(line)
-                chunk_count += 1
-                if chunk_count % 10 == 0:
-                    llm_logger.debug(f"Received {chunk_count} chunks, accumulated {len(assembled)} chars")
-                    print(f"[STREAMING] {chunk_count} chunks, {len(assembled)} chars...")
-            except Exception:
-                assembled += line
-                last_chunk = line
-                continue
-            last_chunk = chunk
-            msg = chunk.get("message", {}).get("content", "")
-            if msg:
-                assembled += msg
-            if chunk.get("done"):
-                llm_logger.info(f"Streaming complete: {chunk_count} chunks, {len(assembled)} chars total")
-                print(f"[STREAMING] Done: {chunk_count} chunks, {len(assembled)} total chars")
-                break
+        # The scanner sees each piece as it arrives and yields the answer as soon
+        # as its closing brace streams in, so we can stop reading right there
+        scanner = _JsonObjectScanner(array=array)
+        # Checked once; the per-chunk progress line is only formatted when it will be emitted
+        debug_enabled = llm_logger.isEnabledFor(logging.DEBUG)
+        extracted = None
+        try:
+            r.raise_for_status()
+            # Keep lines as bytes for the JSON decoder and read in large chunks; Ollama
+            # streams with chunked encoding, so each arriving chunk is still yielded promptly
+            first_line = True
+            for line in r.iter_lines(chunk_size=65536):
+                if time.perf_counter() > deadline:
+                    raise TimeoutError(f"No complete response within {OLLAMA_TOTAL_BUDGET}s")
+                if first_line:
+                    # Generation has started; from here on a long silence means a stuck server
+                    _set_read_timeout(r, OLLAMA_CALL_TIMEOUT)
+                    first_line = False
+                if not line:
+                    continue
+                # Each line should be a small JSON chunk; try to parse it, otherwise append raw
+                try:
+                    chunk = loads(line)
+                    chunk_count += 1
+                    if chunk_count % 10 == 0 and debug_enabled:
+                        llm_logger.debug("Received %d chunks, accumulated %d chars", chunk_count, assembled_len)
+                except Exception:
+                    line = line.decode("utf-8", "replace")
+                    parts.append(line)
+                    assembled_len += len(line)
+                    last_chunk = line
+                    extracted = scanner.feed(line) or extracted
+                    continue
+                last_chunk = chunk
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                msg = chunk.get("message", {}).get("content", "")
+                if msg:
+                    parts.append(msg)
+                    assembled_len += len(msg)
+                    found = scanner.feed(msg)
+                    if found:
+                        extracted = found
+                        try:
+                            result = loads(found)
+                        except Exception as e:
+                            # Keep reading; the full response gets one more chance below
+                            logging.debug("Failed to parse streamed JSON object: %s", e)
+                        else:
+                            llm_logger.info("Streaming: JSON value complete after %d chunks, closing stream", chunk_count)
+                            return result
+                if chunk.get("done"):
+                    llm_logger.info("Streaming complete: %d chunks, %d chars total", chunk_count, assembled_len)
+                    break
+        finally:
+            r.close()
+
+        assembled = "".join(parts)
 
         if assembled:
             try:
-                return json.loads(assembled)
+                return loads(assembled)
             except Exception as e:
                 # Dump assembled content for inspection
                 dump_path = os.path.join(DEBUG_DUMP_DIR, f"llm_stream_assembled_{int(time.time())}.txt")
                 try:
+                    _ensure_debug_dir()
                     with open(dump_path, "w", encoding="utf-8") as fh:
                         fh.write(assembled)
-                    logging.debug("Wrote assembled streamed content to %s", dump_path)
-                    llm_logger.debug(f"Wrote assembled streamed content to {dump_path}")
+                    llm_logger.debug("Wrote assembled streamed content to %s", dump_path)
                 except Exception:
-                    logging.debug("Failed to write assembled dump: %s", traceback.format_exc())
-                # Attempt to salvage by extracting the first JSON object within the assembled text
-                extracted = _extract_first_json_object(assembled)
+                    logging.debug("Failed to write assembled dump", exc_info=True)
+                # Salvage the first JSON object the scanner found, if any
                 if extracted:
                     try:
-                        return json.loads(extracted)
+                        return loads(extracted)
                     except Exception as e2:
                         logging.debug("Failed to parse extracted JSON object: %s", e2)
-                        llm_logger.error(f"Failed to parse extracted JSON: {e2}")
+                        llm_logger.error("Failed to parse extracted JSON: %s", e2)
                 raise RuntimeError(f"Failed to parse assembled streamed content: {assembled} (error: {e})")
 
         # If we reach here, no usable assembled content was found
-        llm_logger.error(f"No usable content from streaming. Last chunk: {last_chunk}")
+        llm_logger.error("No usable content from streaming. Last chunk: %s", last_chunk)
         raise RuntimeError(f"LLM returned no usable content. Last chunk: {last_chunk}")
 
     except Exception as exc_stream:
-        logging.debug("Full stack: %s", traceback.format_exc())
-        llm_logger.error(f"Streaming request failed: {type(exc_stream).__name__}: {exc_stream}")
-        print(f"[ERROR] Streaming request failed: {exc_stream}")
-        raise RuntimeError(
+        logging.debug("Full stack", exc_info=True)
+        llm_logger.error("Streaming request failed: %s: %s", type(exc_stream).__name__, exc_stream)
+        raise _failure_type(exc_stream)(
             f"LLM analysis failed — ensure Ollama is running and reachable at {OLLAMA_URL}. Error: {exc_stream}"
-        )
+        ) from exc_stream
 
 
 def check_ollama(timeout: int = 5, model: str = OLLAMA_MODEL) -> dict:
@@ -232,44 +457,40 @@ def check_ollama(timeout: int = 5, model: str = OLLAMA_MODEL) -> dict:
     """
     results = {"url": OLLAMA_URL, "model": model, "get": {}, "post": {}, "ok": False}
     
-    print(f"\n[DIAGNOSTIC] Checking Ollama at {OLLAMA_URL}")
-    print(f"[DIAGNOSTIC] GET timeout: {timeout}s")
+    llm_logger.info("Checking Ollama at %s (GET timeout %ss)", OLLAMA_URL, timeout)
 
     # Try a simple GET (may return 405 but that's still a reachable service)
     try:
-        print(f"[DIAGNOSTIC] Attempting GET request...")
         start = time.perf_counter()
-        r = requests.get(OLLAMA_URL, timeout=timeout)
+        r = _SESSION.get(OLLAMA_URL, timeout=timeout)
         elapsed = time.perf_counter() - start
         results["get"]["status_code"] = getattr(r, "status_code", None)
         results["get"]["elapsed"] = round(elapsed, 3)
         results["get"]["text_snippet"] = (r.text or "")[:2000]
-        print(f"[DIAGNOSTIC] GET response: {r.status_code} ({elapsed:.3f}s)")
+        llm_logger.info("Diagnostic GET response: %s (%.3fs)", r.status_code, elapsed)
     except Exception as e:
         results["get"]["error"] = repr(e)
         results["get"]["error_type"] = type(e).__name__
-        print(f"[DIAGNOSTIC] GET failed: {type(e).__name__}: {e}")
+        llm_logger.warning("Diagnostic GET failed: %s: %s", type(e).__name__, e)
 
     # Try a minimal POST similar to analyze_filing payload (non-streaming)
-    payload = {"model": model, "messages": build_prompt("ping"), "temperature": 0.0, "stream": False}
+    payload = _encode_payload(model, 0.0, dumps(build_prompt("ping")), False)
     try:
         post_timeout = max(timeout, 10)
-        print(f"[DIAGNOSTIC] Attempting POST request (timeout: {post_timeout}s)...")
         start = time.perf_counter()
-        r = requests.post(OLLAMA_URL, json=payload, timeout=post_timeout)
+        r = _SESSION.post(OLLAMA_URL, data=payload, timeout=post_timeout)
         elapsed = time.perf_counter() - start
         results["post"]["status_code"] = getattr(r, "status_code", None)
         results["post"]["elapsed"] = round(elapsed, 3)
         # capture a short snippet to avoid huge logs
         results["post"]["text_snippet"] = (r.text or "")[:2000]
-        print(f"[DIAGNOSTIC] POST response: {r.status_code} ({elapsed:.3f}s)")
+        llm_logger.info("Diagnostic POST response: %s (%.3fs)", r.status_code, elapsed)
         if 200 <= results["post"]["status_code"] < 300:
             results["ok"] = True
-            print(f"[DIAGNOSTIC] SUCCESS: Ollama is reachable and responding")
     except Exception as e:
         results["post"]["error"] = repr(e)
         results["post"]["error_type"] = type(e).__name__
-        print(f"[DIAGNOSTIC] POST failed: {type(e).__name__}: {e}")
+        llm_logger.warning("Diagnostic POST failed: %s: %s", type(e).__name__, e)
 
     # Helpful suggestions for common cases
     suggestions = []
@@ -286,27 +507,21 @@ def check_ollama(timeout: int = 5, model: str = OLLAMA_MODEL) -> dict:
         if results["get"].get("status_code") == 405 and results["post"].get("status_code"):
             suggestions.append("GET returned 405 (method not allowed) — that's normal for the chat endpoint. Use POST to interact.")
     results["suggestions"] = suggestions
-    
-    if suggestions:
-        print(f"\n[DIAGNOSTIC] Suggestions:")
-        for suggestion in suggestions:
-            print(f"  - {suggestion}")
-    
+
     return results
 
 
 def _text_from_html_file(path: str) -> str:
     """Very small helper to extract visible text from an HTML file for local testing."""
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        with open(path, "rb") as fh:
             raw = fh.read()
     except Exception:
         raise
-    # Strip script/style and tags — naive but good enough for a quick test
-    raw = re.sub(r"(?is)<(script|style).*?>.*?</\1>", " ", raw)
-    raw = re.sub(r"(?is)<[^>]+>", " ", raw)
+    # Same lxml extraction the monitor uses (script/style dropped), uncapped
+    raw = document_text(raw, limit=None)
     # collapse whitespace
-    text = re.sub(r"\s+", " ", raw).strip()
+    text = _WS_RE.sub(" ", raw).strip()
     return text
 
 
@@ -1,181 +1,405 @@
 """Orchestrator for fetching, filtering, analyzing, alerting, and persisting state."""
 import traceback
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import signal
 from pathlib import Path
-import requests
 from datetime import datetime
 import logging
+import threading
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
+import requests
 
-from .config import TRACKED_COMPANIES, SEC_HEADERS, OLLAMA_URL
+from .config import (
+    TRACKED_COMPANIES,
+    OLLAMA_URL,
+    MAX_CONCURRENT_FILINGS,
+    MAX_CONCURRENT_COMPANIES,
+    LLM_BATCH_SIZE,
+    LLM_BATCH_MAX_CHARS,
+    MAX_FILING_ATTEMPTS,
+    LOG_FILE,
+    LOG_LEVEL,
+)
 from .storage import storage
-from .edgar import fetch_filings, extract_text
+from .edgar import fetch_filings, extract_texts, fetch_document, SHORT_TEXT_CHARS
 from .filters import prefilter, text_hash
-from .llm import analyze_filing, check_ollama
+from .llm import analyze_filing, analyze_filings_batch, check_ollama, OllamaTimeoutError, OllamaUnavailableError
 from .alerts import should_alert, format_alert
-from .emailer import send_email
+from .emailer import send_email, close_smtp
 
-# Setup basic logging with timestamps
+# Setup basic logging with timestamps; per-filing detail goes to the log
+# (a rotating file when LOG_FILE is set), stdout keeps only run summaries
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=getattr(logging, LOG_LEVEL.upper(), logging.INFO),
     format='[%(asctime)s] %(levelname)-8s %(name)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
+    datefmt='%Y-%m-%d %H:%M:%S',
+    handlers=[RotatingFileHandler(LOG_FILE, maxBytes=10 * 2**20, backupCount=3)] if LOG_FILE else None,
 )
 logger = logging.getLogger(__name__)
 
-def process_company(symbol: str, company: dict):
+# Per-form minimum length thresholds (characters)
+FORM_MIN_CHARS = {
+    "4": 300,
+    "3": 300,
+    "5": 300,
+    "8-K": 800,
+    "10-Q": 2000,
+    "10-K": 3000,
+    "13F-HR": 1000,
+    "S-1": 2000,
+    "SC 13G": 800,
+    "SC 13D": 800,
+}
+
+# Small shared pool for debug dumps so disk writes don't delay analysis
+_DEBUG_WRITER = ThreadPoolExecutor(max_workers=2, thread_name_prefix="debug-raw")
+
+# Set by the first SIGTERM: batches already running finish, the rest of the
+# cycle is skipped (those filings stay unprocessed for the next run) and the
+# long-poll loop exits
+_STOP = threading.Event()
+
+def _request_stop(signum, frame):
+    logger.warning("Stop requested; finishing in-flight filings (signal again to exit immediately)")
+    _STOP.set()
+    # A second SIGTERM gets the default behaviour and ends the process at once
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+def _save_raw_response(acc: str, url: str):
+    try:
+        debug_dir = Path(__file__).parent / "debug_raw"
+        debug_dir.mkdir(exist_ok=True)
+        raw_path = debug_dir / f"{acc}.html"
+        raw_path.write_bytes(fetch_document(url))
+        logger.info("Saved raw response for %s to %s", acc, raw_path)
+    except Exception as e:
+        logger.warning("Failed to save raw response for %s: %s", acc, e)
+
+def _retry_or_give_up(row: Tuple[str, str, str, str], error: Exception) -> Optional[Tuple[str, str, str, str]]:
+    """Leave a failed filing for the next cycle, at most MAX_FILING_ATTEMPTS times.
+
+    Returns None while attempts remain; after that the filing's row, so it is
+    recorded as processed and no longer retried every cycle.
+    """
+    acc = row[0]
+    attempts = storage.record_failure(acc, f"{type(error).__name__}: {error}")
+    if attempts < MAX_FILING_ATTEMPTS:
+        logger.warning("%s failed (attempt %d of %d); will retry next cycle: %s", acc, attempts, MAX_FILING_ATTEMPTS, error)
+        return None
+    logger.error("Giving up on %s after %d attempts: %s", acc, attempts, error)
+    return row
+
+def collect_filings(symbol: str, company: dict) -> List[dict]:
+    """Fetch a company's unseen filings and their text.
+
+    Returns one work item per filing that downloaded successfully, ready for
+    `process_filing`.
+    """
     cik = company.get("cik")
-    logger.info(f"Starting processing for {symbol} (CIK={cik})")
-    print(f"\n{'='*70}")
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Processing {symbol} (CIK={cik})")
-    print(f"{'='*70}")
+    logger.info("Starting processing for %s (CIK=%s)", symbol, cik)
     filings = fetch_filings(cik)
-    logger.debug(f"Fetched {len(filings)} filings for {symbol}")
-    print(f"Found {len(filings)} filings")
+    logger.debug("Fetched %d filings for %s", len(filings), symbol)
+    new_filings = []
     for f in filings:
         acc = f["accession_number"]
         if storage.is_processed(acc):
-            # Stop once we hit already-seen filing (list is newest->oldest)
-            logger.debug(f"Already processed {acc}; stopping further older filings for {symbol}")
-            print(f"Already processed {acc}; stopping")
-            break
-
-        try:
-            logger.debug(f"Fetching primary doc for {symbol} {acc}")
-            print(f"  [FETCH] {acc} from {f['primary_doc_url'][:80]}...")
-            text = extract_text(f["primary_doc_url"])
-            logger.debug(f"Successfully extracted text for {acc}, length={len(text) if text else 0}")
-        except Exception as e:
-            logger.error(f"Failed to fetch/extract {acc}: {e}")
-            print(f"  [ERROR] Failed to fetch {acc}: {e}")
+            # Keep scanning past seen filings: an older one may have been left
+            # unprocessed (Ollama unavailable, or a failure still under
+            # MAX_FILING_ATTEMPTS) and is retried now
+            logger.debug("Already processed %s for %s", acc, symbol)
             continue
+        new_filings.append(f)
 
-        # Per-form minimum length thresholds (characters)
-        FORM_MIN_CHARS = {
-            "4": 300,
-            "3": 300,
-            "5": 300,
-            "8-K": 800,
-            "10-Q": 2000,
-            "10-K": 3000,
-            "13F-HR": 1000,
-            "S-1": 2000,
-            "SC 13G": 800,
-            "SC 13D": 800,
-        }
-
-        form = (f.get("form_type") or "").upper().strip()
-        min_chars = FORM_MIN_CHARS.get(form, 1500)
-
-        # Log text length for tuning thresholds
-        text_len = len(text) if text else 0
-        logger.info(f"Text length for {acc}: {text_len} chars (form: {form}, min required: {min_chars})")
-        print(f"  [TEXT] {text_len} chars (form={form}, min={min_chars})")
-
-        # If the extracted text is unexpectedly short, save the raw response
-        # so you can inspect it locally (helps diagnose SEC blocks or parser
-        # issues). Files are written to src/debug_raw/{accession}.html
-        # if text_len < max(500, min_chars):
-        try:
-            debug_dir = Path(__file__).parent / "debug_raw"
-            debug_dir.mkdir(exist_ok=True)
-            raw_path = debug_dir / f"{acc}.html"
-            r = requests.get(f["primary_doc_url"], headers=SEC_HEADERS, timeout=20)
-            r.raise_for_status()
-            raw_path.write_text(r.text, encoding="utf-8")
-            print(f"Saved raw response for {acc} to {raw_path}")
-        except Exception as e:
-            print(f"Failed to save raw response for {acc}: {e}")
+    for f in new_filings:
+        logger.debug("Fetching primary doc for %s %s", symbol, f["accession_number"])
+    # Normalized once per filing: the form labels the work item and picks its minimum length
+    forms = [(f.get("form_type") or "").upper().strip() for f in new_filings]
+    min_chars_by_item = [FORM_MIN_CHARS.get(form, 1500) for form in forms]
+    # Download all new primary docs concurrently. Visible text can't be longer
+    # than the raw body, so bodies shorter than the form's minimum are rejected
+    # by extract_texts without being parsed
+    texts = extract_texts(
+        [f["primary_doc_url"] for f in new_filings],
+        min_bytes=min_chars_by_item,
+        accessions=[f["accession_number"] for f in new_filings],
+    )
 
-        if not prefilter(text, min_chars=min_chars):
-            logger.info(f"Prefilter rejected {acc} (length {text_len} < {min_chars})")
-            print(f"  [SKIP] Prefilter rejected: text too short ({text_len} < {min_chars})")
-            storage.mark_processed(acc, cik, f.get("form_type"), f.get("filing_date"))
+    items = []
+    for f, form, form_min, text in zip(new_filings, forms, min_chars_by_item, texts):
+        acc = f["accession_number"]
+        if isinstance(text, Exception):
+            logger.error("Failed to fetch/extract %s: %s", acc, text)
+            # Network trouble is retried freely; a 404 or an unparseable body
+            # would fail the same way every cycle
+            if not isinstance(text, (requests.ConnectionError, requests.Timeout)):
+                row = _retry_or_give_up((acc, cik, f.get("form_type"), f.get("filing_date")), text)
+                if row is not None:
+                    storage.mark_processed_bulk([row])
             continue
+        logger.debug("Successfully extracted text for %s, length=%d", acc, len(text) if text else 0)
+        items.append(
+            {
+                "symbol": symbol,
+                "cik": cik,
+                "filing": f,
+                "text": text,
+                "form": form,
+                "min_chars": form_min,
+            }
+        )
+    return items
+
+def process_filing(item: dict, analysis: Optional[dict] = None) -> Optional[Tuple[str, str, str, str]]:
+    """Prefilter, analyze and alert on a single collected filing.
+
+    `analysis` is passed in when the filing was already analyzed as part of a
+    batch; otherwise the LLM is called here. Returns the filing's
+    processed_filings row; callers record rows together with
+    `storage.mark_processed_bulk`. Returns None when Ollama was unavailable or
+    timed out, leaving the filing unprocessed so the next cycle retries it
+    (timeouts only up to MAX_FILING_ATTEMPTS times). Alerts are still recorded
+    immediately, since the email has already gone out.
+    """
+    symbol, cik, f, text = item["symbol"], item["cik"], item["filing"], item["text"]
+    form, min_chars = item["form"], item["min_chars"]
+    acc = f["accession_number"]
+    row = (acc, cik, f.get("form_type"), f.get("filing_date"))
+
+    # Log text length for tuning thresholds
+    text_len = len(text) if text else 0
+    logger.info("Text length for %s: %d chars (form: %s, min required: %d)", acc, text_len, form, min_chars)
+
+    # If the extracted text is unexpectedly short, save the raw response so you
+    # can inspect it locally (helps diagnose SEC blocks or parser issues, which
+    # usually fail the prefilter below). Files are written to
+    # src/debug_raw/{accession}.html in the background, off the analyze path;
+    # edgar keeps these bodies from the download, so nothing is fetched twice
+    if text_len < SHORT_TEXT_CHARS:
+        _DEBUG_WRITER.submit(_save_raw_response, acc, f["primary_doc_url"])
 
-        # Optional dedupe via hash could be persisted in future. For now compute hash for logging.
+    if not prefilter(text, min_chars=min_chars):
+        logger.info("Prefilter rejected %s (length %d < %d)", acc, text_len, min_chars)
+        return row
+
+    if analysis is None:
+        # Hash once; reused as the LLM cache key so analyze_filing doesn't re-hash.
+        # Identical text (re-filings, repeated exhibits) is answered from the cache
         thash = text_hash(text)
         # print(f"Text hash: {thash[:10]}...")
 
         try:
-            logger.info(f"Starting LLM analysis for {acc} (chars={text_len})...")
-            print(f"  [LLM] Analyzing with Ollama at {OLLAMA_URL}...")
-            analysis = analyze_filing(text)
-            logger.info(f"LLM analysis completed for {acc}: impact_level={analysis.get('impact_level')}")
-            print(f"  [LLM] Analysis complete: impact={analysis.get('impact_level')}")
+            logger.info("Starting LLM analysis for %s (chars=%d)...", acc, text_len)
+            analysis = analyze_filing(text, cache=True, content_hash=thash)
+            logger.info("LLM analysis completed for %s: impact_level=%s", acc, analysis.get("impact_level"))
+        except OllamaUnavailableError as e:
+            logger.warning("LLM unavailable for %s; will retry next cycle: %s", acc, e)
+            return None
+        except OllamaTimeoutError as e:
+            # Possibly the filing's own fault (too long a prompt for this host), so retries are capped
+            logger.error("LLM analysis timed out for %s: %s", acc, e)
+            return _retry_or_give_up(row, e)
         except Exception as e:
-            logger.error(f"LLM analysis FAILED for {acc}: {type(e).__name__}: {e}")
-            print(f"  [ERROR] LLM analysis failed: {e}")
+            logger.error("LLM analysis FAILED for %s: %s: %s", acc, type(e).__name__, e)
             # Discard on JSON parse failure for now, mark processed so we don't retry.
-            storage.mark_processed(acc, cik, f.get("form_type"), f.get("filing_date"))
+            return row
+
+    if should_alert(analysis):
+        try:
+            # Check, send and record under the storage lock (held by the
+            # transaction), so two workers can't both email the same filing
+            with storage.transaction():
+                if storage.has_alert(acc):
+                    logger.debug("Alert already sent for %s", acc)
+                else:
+                    logger.info("Alert triggered for %s (impact: %s)", acc, analysis.get("impact_level"))
+                    subject, body = format_alert(symbol, f, analysis)
+                    send_email(subject, body)
+                    storage.mark_alert_sent(acc, analysis.get("impact_level", "None"), {"symbol": symbol})
+                    logger.info("Alert email sent for %s", acc)
+        except Exception as e:
+            logger.error("Failed to send alert for %s: %s", acc, e)
+    else:
+        logger.debug("No alert for %s (impact %s)", acc, analysis.get("impact_level"))
+
+    logger.info("Completed processing for %s", acc)
+    # Mark processed regardless so we don't reprocess repeatedly
+    return row
+
+def process_batch(items: List[dict]) -> List[Tuple[str, str, str, str]]:
+    """Analyze a batch of short filings with one LLM call, then finish each filing.
+
+    Falls back to a separate LLM call per filing if the batched reply can't be
+    used. A single-item batch is just `process_filing`. Returns the
+    processed_filings rows of the filings that finished; if Ollama is
+    unavailable the whole batch is left for the next cycle.
+    """
+    if _STOP.is_set():
+        return []
+    analyses: List[Optional[dict]] = [None] * len(items)
+    if len(items) > 1:
+        accs = ", ".join(item["filing"]["accession_number"] for item in items)
+        try:
+            logger.info("Starting batched LLM analysis for %s...", accs)
+            texts = [item["text"] for item in items]
+            analyses = analyze_filings_batch(texts, cache=True, content_hashes=[text_hash(t) for t in texts])
+        except OllamaUnavailableError as e:
+            # One call per filing would only queue more work on a server that isn't answering
+            logger.warning("LLM unavailable for %s; will retry next cycle: %s", accs, e)
+            return []
+        except Exception as e:
+            # Including OllamaTimeoutError: a batch can time out where its filings alone wouldn't
+            logger.warning("Batched LLM analysis failed for %s, analyzing one by one: %s: %s", accs, type(e).__name__, e)
+    rows = []
+    for item, analysis in zip(items, analyses):
+        try:
+            row = process_filing(item, analysis)
+        except Exception as e:
+            logger.error("Error processing %s: %s", item["filing"]["accession_number"], e, exc_info=True)
             continue
+        if row is not None:
+            rows.append(row)
+    return rows
 
-        if should_alert(analysis) and not storage.has_alert(acc):
-            logger.info(f"Alert triggered for {acc} (impact: {analysis.get('impact_level')})")
-            subject, body = format_alert(symbol, f, analysis)
-            try:
-                print(f"  [ALERT] Sending email for {acc}...")
-                send_email(subject, body)
-                storage.mark_alert_sent(acc, analysis.get("impact_level", "None"), {"symbol": symbol})
-                logger.info(f"Alert email sent for {acc}")
-                print(f"  [ALERT] Email sent successfully")
-            except Exception as e:
-                logger.error(f"Failed to send alert for {acc}: {e}")
-                print(f"  [ERROR] Failed to send alert email: {e}")
+def plan_batches(items: List[dict]) -> List[List[dict]]:
+    """Group short filings of the same form into LLM batches; everything else goes alone."""
+    batches = []
+    by_form: Dict[str, List[dict]] = {}
+    for item in items:
+        text = item["text"]
+        if (
+            LLM_BATCH_SIZE > 1
+            and text
+            and len(text) <= LLM_BATCH_MAX_CHARS
+            and prefilter(text, min_chars=item["min_chars"])
+        ):
+            group = by_form.setdefault(item["form"], [])
+            group.append(item)
+            if len(group) == LLM_BATCH_SIZE:
+                batches.append(group)
+                by_form[item["form"]] = []
         else:
-            logger.debug(f"No alert for {acc} (impact {analysis.get('impact_level')})")
-            print(f"  [SKIP] No alert (impact={analysis.get('impact_level')})")
+            batches.append([item])
+    batches.extend(group for group in by_form.values() if group)
+    return batches
 
-        # Mark processed regardless so we don't reprocess repeatedly
-        storage.mark_processed(acc, cik, f.get("form_type"), f.get("filing_date"))
-        logger.info(f"Completed processing for {acc}")
+def _safe_collect(symbol: str, company: dict) -> List[dict]:
+    if _STOP.is_set():
+        return []
+    try:
+        return collect_filings(symbol, company)
+    except Exception as e:
+        logger.error("Error processing %s: %s", symbol, e, exc_info=True)
+        return []
 
-def main(poll_once: bool = True):
-    logger.info("="*70)
-    logger.info(f"Monitor started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    logger.info(f"Ollama URL configured: {OLLAMA_URL}")
-    logger.info(f"Poll once mode: {poll_once}")
-    
-    # Run upfront Ollama connectivity check
+def _collect_all() -> List[List[dict]]:
+    """Collect every tracked company's new filings, in TRACKED_COMPANIES order."""
+    companies = list(TRACKED_COMPANIES.items())
+    if MAX_CONCURRENT_COMPANIES <= 1 or len(companies) <= 1:
+        return [_safe_collect(symbol, company) for symbol, company in companies]
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_COMPANIES, len(companies))) as ex:
+        return list(ex.map(lambda kv: _safe_collect(*kv), companies))
+
+def run_cycle():
+    """Collect new filings for every tracked company, then process them concurrently.
+
+    Companies are collected in parallel (SEC requests stay under edgar's shared
+    cap), then filings from all companies share one bounded pool, so LLM and
+    SEC waits overlap across tickers instead of running one filing at a time.
+    Short filings of the same form are analyzed together (see `plan_batches`).
+    """
+    items = []
+    seen = set()
+    for batch in _collect_all():
+        for item in batch:
+            # Joint filings show up under each co-registrant; analyze them once
+            acc = item["filing"]["accession_number"]
+            if acc in seen:
+                logger.debug("Skipping duplicate %s for %s", acc, item["symbol"])
+                continue
+            seen.add(acc)
+            items.append(item)
+    if not items:
+        return
+
+    batches = plan_batches(items)
+    # Processed rows are written in one transaction at the end of the cycle. If
+    # the run dies first, those filings are picked up again next time; their LLM
+    # results are already cached and their alerts already recorded.
+    rows = []
+    try:
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_FILINGS, len(batches))) as ex:
+            futures = {ex.submit(process_batch, batch): batch for batch in batches}
+            for fut in as_completed(futures):
+                try:
+                    rows.extend(fut.result())
+                except Exception as e:
+                    accs = ", ".join(item["filing"]["accession_number"] for item in futures[fut])
+                    logger.error("Error processing %s: %s", accs, e, exc_info=True)
+    finally:
+        if rows:
+            storage.mark_processed_bulk(rows)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Processed {len(items)} new filings")
+
+def _report_ollama_status():
+    """Run the Ollama connectivity check and print its summary as one block."""
     logger.info("Running Ollama connectivity check...")
-    print("\n" + "="*70)
-    print("OLLAMA CONNECTIVITY CHECK")
-    print("="*70)
     ollama_status = check_ollama()
     logger.info(f"Ollama check results: {ollama_status}")
-    print(f"URL: {ollama_status.get('url')}")
-    print(f"GET result: {ollama_status.get('get')}")
-    print(f"POST result: {ollama_status.get('post')}")
-    print(f"Status OK: {ollama_status.get('ok')}")
+    lines = [
+        "=" * 70,
+        "OLLAMA CONNECTIVITY CHECK",
+        "=" * 70,
+        f"URL: {ollama_status.get('url')}",
+        f"GET result: {ollama_status.get('get')}",
+        f"POST result: {ollama_status.get('post')}",
+        f"Status OK: {ollama_status.get('ok')}",
+    ]
     if ollama_status.get('suggestions'):
-        print("\nSuggestions:")
-        for suggestion in ollama_status['suggestions']:
-            print(f"  - {suggestion}")
-    
+        lines.append("\nSuggestions:")
+        lines.extend(f"  - {suggestion}" for suggestion in ollama_status['suggestions'])
+
     if not ollama_status.get('ok'):
         logger.warning("Ollama connectivity check FAILED. Proceeding anyway, but LLM analysis will likely fail.")
-        print("\nWARNING: Ollama connectivity check failed! Analysis will likely timeout.")
+        lines.append("\nWARNING: Ollama connectivity check failed! Analysis will likely timeout.")
     else:
         logger.info("Ollama connectivity check PASSED")
-        print("\nOllama connectivity check passed")
-    
-    print("="*70 + "\n")
+        lines.append("\nOllama connectivity check passed")
+    lines.append("=" * 70 + "\n")
+    # A single write, so the block isn't interleaved with output from the cycle
+    print("\n" + "\n".join(lines))
+
+def main(poll_once: bool = True):
+    logger.info("="*70)
+    logger.info(f"Monitor started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"Ollama URL configured: {OLLAMA_URL}")
+    logger.info(f"Poll once mode: {poll_once}")
     
+    # Probe Ollama in the background: the check's ping also loads the model, so
+    # that happens while the first cycle is still collecting filings from SEC
+    threading.Thread(target=_report_ollama_status, name="ollama-probe", daemon=True).start()
+
+    # SIGTERM stops gracefully so the cleanup below still runs. Filings already
+    # being analyzed are finished first, which can take up to OLLAMA_TOTAL_BUDGET
+    # per LLM call; a second SIGTERM exits without waiting
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _request_stop)
+
     try:
-        for symbol, company in TRACKED_COMPANIES.items():
-            try:
-                process_company(symbol, company)
-            except Exception as e:
-                logger.error(f"Error processing {symbol}: {e}", exc_info=True)
-                print(f"\n[ERROR] Exception processing {symbol}:")
-                print(traceback.format_exc())
+        run_cycle()
         if not poll_once:
-            # Sleep and repeat (cron alternative)
+            # Sleep and repeat (cron alternative); a stop request ends the wait early
             while True:
                 logger.info("Poll cycle complete, sleeping for 30 minutes...")
-                sleep(1800)
-                for symbol, company in TRACKED_COMPANIES.items():
-                    process_company(symbol, company)
+                if _STOP.wait(1800):
+                    logger.info("Stop requested; leaving poll loop")
+                    break
+                run_cycle()
     finally:
+        # Let pending debug dumps finish before the process exits
+        _DEBUG_WRITER.shutdown(wait=True)
+        close_smtp()
         try:
             logger.info("Closing storage connection...")
             storage.close()
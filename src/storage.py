@@ -1,6 +1,9 @@
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 import json
 from .config import DB_PATH
 
@@ -8,7 +11,24 @@ class Storage:
     def __init__(self, db_path: Optional[str] = None):
         self.db_path = db_path or DB_PATH
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # WAL + synchronous=NORMAL: a commit appends to the log without an fsync;
+        # durability is only traded for crashes of the whole OS, not of this process
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-65536")
+        # The connection is shared by the monitor's worker threads; serialize access
+        self._lock = threading.RLock()
+        # >0 while a transaction() block is open; single-row writes then skip their commit
+        self._tx_depth = 0
         self._ensure_tables()
+        self._load_seen()
+
+    def _load_seen(self):
+        # Seen accession numbers, loaded once so the per-filing "already processed /
+        # already alerted" checks are set lookups; kept in step by the mark_* methods
+        self._processed = {row[0] for row in self.conn.execute("SELECT accession_number FROM processed_filings")}
+        self._alerted = {row[0] for row in self.conn.execute("SELECT accession_number FROM alerts_sent")}
 
     def _ensure_tables(self):
         c = self.conn.cursor()
@@ -33,36 +53,151 @@ class Storage:
             )
             """
         )
-        self.conn.commit()
-
-    def is_processed(self, accession_number: str) -> bool:
-        c = self.conn.cursor()
         c.execute(
-            "SELECT 1 FROM processed_filings WHERE accession_number = ? LIMIT 1",
-            (accession_number,)
+            """
+            CREATE TABLE IF NOT EXISTS filings_cache (
+                accession_number TEXT PRIMARY KEY,
+                text TEXT,
+                fetched_at TEXT
+            )
+            """
         )
-        return c.fetchone() is not None
-
-    def mark_processed(self, accession_number: str, cik: str, form_type: str, filing_date: str):
-        c = self.conn.cursor()
         c.execute(
-            "INSERT OR IGNORE INTO processed_filings (accession_number, cik, form_type, filing_date, processed_at) VALUES (?,?,?,?,?)",
-            (accession_number, cik, form_type, filing_date, datetime.utcnow().isoformat()),
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                created_at INTEGER,
+                response TEXT
+            )
+            """
+        )
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS failed_attempts (
+                accession_number TEXT PRIMARY KEY,
+                attempts INTEGER,
+                last_error TEXT,
+                updated_at TEXT
+            )
+            """
+        )
+        # Per-company history lookups (latest filings for a CIK) without a table scan
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_proc_cik_date ON processed_filings(cik, filing_date DESC)"
         )
         self.conn.commit()
 
+    def _commit(self):
+        if not self._tx_depth:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes into a single commit at the end of the block.
+
+        Like sqlite3's connection context manager, the writes are rolled back
+        if the block raises. Nested blocks join the outermost one. The storage
+        lock is held for the whole block, so keep it to the writes.
+        """
+        with self._lock:
+            self._tx_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._tx_depth -= 1
+                if not self._tx_depth:
+                    self.conn.rollback()
+                    # mark_* calls inside the block already updated the sets
+                    self._load_seen()
+                raise
+            else:
+                self._tx_depth -= 1
+                self._commit()
+
+    def is_processed(self, accession_number: str) -> bool:
+        return accession_number in self._processed
+
+    def mark_processed(self, accession_number: str, cik: str, form_type: str, filing_date: str):
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute(
+                "INSERT OR IGNORE INTO processed_filings (accession_number, cik, form_type, filing_date, processed_at) VALUES (?,?,?,?,?)",
+                (accession_number, cik, form_type, filing_date, datetime.utcnow().isoformat()),
+            )
+            self._commit()
+            self._processed.add(accession_number)
+
+    def mark_processed_bulk(self, rows: List[Tuple[str, str, str, str]]):
+        """Record several (accession_number, cik, form_type, filing_date) rows in one transaction."""
+        now = datetime.utcnow().isoformat()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed_filings (accession_number, cik, form_type, filing_date, processed_at) VALUES (?,?,?,?,?)",
+                [(*row, now) for row in rows],
+            )
+            self._commit()
+            self._processed.update(row[0] for row in rows)
+
+    def record_failure(self, accession_number: str, error: str) -> int:
+        """Count another failed attempt at a filing; returns the attempts so far."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO failed_attempts (accession_number, attempts, last_error, updated_at) VALUES (?,1,?,?) "
+                "ON CONFLICT(accession_number) DO UPDATE SET attempts = attempts + 1, "
+                "last_error = excluded.last_error, updated_at = excluded.updated_at",
+                (accession_number, error[:1000], datetime.utcnow().isoformat()),
+            )
+            (attempts,) = self.conn.execute(
+                "SELECT attempts FROM failed_attempts WHERE accession_number = ?", (accession_number,)
+            ).fetchone()
+            self._commit()
+            return attempts
+
     def has_alert(self, accession_number: str) -> bool:
-        c = self.conn.cursor()
-        c.execute("SELECT 1 FROM alerts_sent WHERE accession_number = ? LIMIT 1", (accession_number,))
-        return c.fetchone() is not None
+        return accession_number in self._alerted
 
     def mark_alert_sent(self, accession_number: str, impact_level: str, meta: dict | None = None):
-        c = self.conn.cursor()
-        c.execute(
-            "INSERT OR IGNORE INTO alerts_sent (accession_number, sent_at, impact_level, meta) VALUES (?,?,?,?)",
-            (accession_number, datetime.utcnow().isoformat(), impact_level, json.dumps(meta or {})),
-        )
-        self.conn.commit()
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute(
+                "INSERT OR IGNORE INTO alerts_sent (accession_number, sent_at, impact_level, meta) VALUES (?,?,?,?)",
+                (accession_number, datetime.utcnow().isoformat(), impact_level, json.dumps(meta or {})),
+            )
+            self._commit()
+            self._alerted.add(accession_number)
+
+    def get_filing_text(self, accession_number: str) -> Optional[str]:
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute("SELECT text FROM filings_cache WHERE accession_number = ? LIMIT 1", (accession_number,))
+            row = c.fetchone()
+            return row[0] if row else None
+
+    def put_filing_text(self, accession_number: str, text: str):
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute(
+                "INSERT OR REPLACE INTO filings_cache (accession_number, text, fetched_at) VALUES (?,?,?)",
+                (accession_number, text, datetime.utcnow().isoformat()),
+            )
+            self._commit()
+
+    def get_llm_response(self, key: str) -> Optional[str]:
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute("SELECT response FROM llm_cache WHERE key = ? LIMIT 1", (key,))
+            row = c.fetchone()
+            return row[0] if row else None
+
+    def put_llm_response(self, key: str, model: str, response: str):
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, created_at, response) VALUES (?,?,?,?)",
+                (key, model, int(time.time()), response),
+            )
+            self._commit()
 
     def close(self):
         try:
@@ -70,4 +205,21 @@ class Storage:
         except Exception:
             pass
 
-storage = Storage()
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> Storage:
+    """Return the shared Storage, opening (and migrating) the database on first use."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = Storage()
+    return _storage
+
+def __getattr__(name: str):
+    # `from .storage import storage` keeps working, but importing this module
+    # alone (e.g. via edgar or llm) no longer opens the database
+    if name == "storage":
+        return get_storage()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
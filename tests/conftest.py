@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Make `src` importable and keep the suite away from the real src/db.sqlite;
+# DB_PATH must be set before src.config is first imported
+proj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if proj_root not in sys.path:
+    sys.path.insert(0, proj_root)
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="market-agent-tests-"), "db.sqlite"))
+
+
+@pytest.fixture
+def fresh_storage(tmp_path, monkeypatch):
+    """An empty database as the shared storage, so cache lookups start cold."""
+    import src.storage
+
+    storage = src.storage.Storage(str(tmp_path / "db.sqlite"))
+    monkeypatch.setattr(src.storage, "_storage", storage)
+    yield storage
+    storage.close()
@@ -0,0 +1,84 @@
+import pytest
+
+import src.edgar as edgar
+
+
+class FakeDownload:
+    def __init__(self, body):
+        self._body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self._body
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    def serve(body):
+        monkeypatch.setattr(edgar._SESSION, "get", lambda url, **kwargs: FakeDownload(body))
+        monkeypatch.setattr(edgar, "_throttle", lambda: None)
+
+    monkeypatch.setattr(edgar, "_SHORT_BODIES", {})
+    return serve
+
+
+@pytest.mark.parametrize(
+    "body, min_bytes",
+    [(b"<html><body>Access Denied</body></html>", 3000), (b"<html><body>Access Denied</body></html>", 0)],
+    ids=["below-min-bytes", "short-text"],
+)
+def test_short_bodies_are_kept_for_the_debug_dump(serve, body, min_bytes):
+    serve(body)
+    edgar._download_text("https://x/a/d.htm", min_bytes)
+    assert edgar.fetch_document("https://x/a/d.htm") == body
+    assert edgar._SHORT_BODIES == {}
+
+
+def test_long_bodies_are_not_kept(serve):
+    serve(b"<html><body><p>" + b"word " * 200 + b"</p></body></html>")
+    assert len(edgar._download_text("https://x/a/d.htm")) >= edgar.SHORT_TEXT_CHARS
+    assert edgar._SHORT_BODIES == {}
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'\xef\xbb\xbf<?xml version="1.0"?><title>Hi</title><script>x</script>',
+        b"<title>Hi</title><script>x</script><style>y</style><noscript>z</noscript>",
+        b'<?xml version="1.0"?><doc>Hi<script>x</script></doc>',
+    ],
+    ids=["bom-before-xml-declaration", "html-without-body", "xml"],
+)
+def test_documents_without_body_drop_script_text(body):
+    assert edgar.document_text(body) == "Hi"
+
+
+def test_bom_before_html_is_ignored():
+    assert edgar.document_text(b"\xef\xbb\xbf<html><body><p>A</p><script>s</script></body></html>") == "A"
+
+
+def test_plain_xml_keeps_all_text():
+    body = b'<?xml version="1.0"?><ownershipDocument><a>1</a><b> two </b></ownershipDocument>'
+    assert edgar.document_text(body) == "1\n two "
+
+
+def test_filings_without_primary_document_get_their_own_cache_rows(serve, fresh_storage):
+    serve(b"<html><body><p>" + b"word " * 200 + b"</p></body></html>")
+    urls = ["https://www.sec.gov/Archives/edgar/data/1932393/000193239324000001/",
+            "https://www.sec.gov/Archives/edgar/data/1932393/000193239324000002/"]
+    edgar.extract_texts(urls, accessions=["0001932393-24-000001", "0001932393-24-000002"])
+    keys = [row[0] for row in fresh_storage.conn.execute("SELECT accession_number FROM filings_cache ORDER BY 1")]
+    assert keys == ["000193239324000001", "000193239324000002"]
+
+
+def test_cache_key_falls_back_to_the_url_accession():
+    assert edgar._cache_key("https://x/data/1932393/000193239324000001/", None) == "000193239324000001"
+    assert edgar._cache_key("https://x/data/1932393/000193239324000001/d.htm", None) == "000193239324000001"
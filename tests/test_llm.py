@@ -0,0 +1,237 @@
+import json
+
+import pytest
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+import src.llm as llm
+
+
+class FakeStream:
+    """Stands in for the streaming requests.Response that _stream_analysis reads."""
+
+    def __init__(self, pieces, done=True, status_code=200):
+        self.status_code = status_code
+        chunks = [{"message": {"content": piece}} for piece in pieces]
+        if done:
+            chunks.append({"done": True})
+        self._lines = [json.dumps(chunk).encode() for chunk in chunks]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+    def iter_lines(self, chunk_size=None):
+        return iter(self._lines)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def debug_dump_dir(tmp_path, monkeypatch):
+    # Unparseable replies are dumped for inspection; keep them out of src/
+    monkeypatch.setattr(llm, "DEBUG_DUMP_DIR", str(tmp_path))
+
+
+def scan(pieces, array=False):
+    scanner = llm._JsonObjectScanner(array=array)
+    found = None
+    for piece in pieces:
+        found = scanner.feed(piece) or found
+    return found
+
+
+def splits(text):
+    """Every way of cutting `text` in two, plus one character at a time."""
+    for i in range(len(text) + 1):
+        yield [text[:i], text[i:]]
+    yield list(text)
+
+
+def test_llm_exposes_check_ollama():
+    assert callable(llm.check_ollama)
+
+
+OBJECT = r'{"a": "say \"hi\" \\", "b": "}{ [", "c": {"d": [1, 2]}}'
+
+
+@pytest.mark.parametrize("pieces", list(splits(OBJECT)))
+def test_scanner_handles_any_split(pieces):
+    assert scan(pieces) == OBJECT
+    assert json.loads(scan(pieces))["a"] == 'say "hi" \\'
+
+
+def test_scanner_escaped_quote_split_after_backslash():
+    found = scan(['{"a": "x\\', '""}', " more"])
+    assert found == '{"a": "x\\""}'
+    assert json.loads(found) == {"a": 'x"'}
+
+
+def test_scanner_escaped_backslash_split_before_closing_quote():
+    assert scan(['{"a": "x\\', '\\"}']) == '{"a": "x\\\\"}'
+
+
+def test_scanner_ignores_braces_in_strings():
+    assert scan(['{"a": "} {', ' }", "b": 1}']) == '{"a": "} { }", "b": 1}'
+
+
+def test_scanner_skips_preamble_and_trailing_text():
+    assert scan(["Sure, here is the JSON:\n", '{"a": 1}', "\nHope this helps {"]) == '{"a": 1}'
+
+
+def test_scanner_returns_nothing_for_truncated_object():
+    assert scan(['{"a": {"b": 1}', ', "c": "}']) is None
+
+
+def test_stream_analysis_returns_first_object(monkeypatch):
+    stream = FakeStream(["Here: ", '{"impact_level": ', '"High"}', " trailing"])
+    monkeypatch.setattr(llm._SESSION, "post", lambda *a, **k: stream)
+    assert llm._stream_analysis(llm.build_prompt("x"), "m", 0.0, False) == {"impact_level": "High"}
+
+
+def test_stream_analysis_raises_on_truncated_stream(monkeypatch):
+    stream = FakeStream(['{"impact_level": "High", ', '"summary_bullets": ["a"'])
+    monkeypatch.setattr(llm._SESSION, "post", lambda *a, **k: stream)
+    with pytest.raises(RuntimeError):
+        llm._stream_analysis(llm.build_prompt("x"), "m", 0.0, False)
+
+
+def test_batch_and_single_analyses_are_cached_separately(monkeypatch, fresh_storage):
+    calls = []
+
+    def fake_request(messages, model, temperature, array=False):
+        calls.append(array)
+        return [{"impact_level": "batch"}] if array else {"impact_level": "single"}
+
+    monkeypatch.setattr(llm, "_request_analysis", fake_request)
+    assert llm.analyze_filings_batch(["same text"], cache=True) == [{"impact_level": "batch"}]
+    assert llm.analyze_filing("same text", cache=True) == {"impact_level": "single"}
+    assert llm.analyze_filings_batch(["same text"], cache=True) == [{"impact_level": "batch"}]
+    assert llm.analyze_filing("same text", cache=True) == {"impact_level": "single"}
+    assert calls == [True, False]
+
+
+ARRAY = r'[{"a": "] [", "b": [1, [2]]}, {"c": "\"]"}]'
+
+
+@pytest.mark.parametrize("pieces", list(splits(ARRAY)))
+def test_array_scanner_handles_any_split(pieces):
+    assert scan(pieces, array=True) == ARRAY
+    assert json.loads(scan(pieces, array=True))[1] == {"c": '"]'}
+
+
+def test_array_scanner_skips_preamble_with_braces():
+    assert scan(['Here {are} the results: ', '[{"a": 1}', ', {"b": 2}]'], array=True) == '[{"a": 1}, {"b": 2}]'
+
+
+def test_array_scanner_returns_nothing_for_truncated_array():
+    assert scan(['[{"a": 1}, {"b": "]"}'], array=True) is None
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [[{"i": 0}], [{"i": 0}, {"i": 1}, {"i": 2}], [{"i": 0}, ["i", 1]], {"i": 0}],
+    ids=["too-short", "too-long", "bad-item", "not-a-list"],
+)
+def test_batch_rejects_reply_of_wrong_shape(monkeypatch, reply):
+    monkeypatch.setattr(llm, "_request_analysis", lambda *a, **k: reply)
+    with pytest.raises(ValueError):
+        llm.analyze_filings_batch(["a", "b"])
+
+
+def test_batch_partial_cache_hit_keeps_order(monkeypatch, fresh_storage):
+    sent = []
+
+    def fake_request(messages, model, temperature, array=False):
+        docs = [line.split(": ", 1)[1] for line in messages[-1]["content"].splitlines() if line.startswith("DOC ")]
+        sent.append(docs)
+        return [{"doc": doc} for doc in docs]
+
+    monkeypatch.setattr(llm, "_request_analysis", fake_request)
+    llm.analyze_filings_batch(["b", "d"], cache=True)
+    results = llm.analyze_filings_batch(["a", "b", "c", "d"], cache=True)
+    assert results == [{"doc": "a"}, {"doc": "b"}, {"doc": "c"}, {"doc": "d"}]
+    assert sent == [["b", "d"], ["a", "c"]]
+
+
+def test_payload_sends_temperature_as_an_option():
+    payload = json.loads(llm._encode_payload("m", 0.25, llm.dumps(llm.build_prompt("x")), True))
+    assert "temperature" not in payload
+    assert payload["options"] == {"num_ctx": llm.OLLAMA_NUM_CTX, "temperature": 0.25}
+    assert payload["messages"][-1] == {"role": "user", "content": "x"}
+    assert payload["stream"] is True
+
+
+@pytest.mark.parametrize(
+    "error",
+    [requests.ConnectTimeout("connect"), requests.ConnectionError("refused")],
+    ids=["connect-timeout", "refused"],
+)
+def test_unreachable_server_raises_unavailable(monkeypatch, error):
+    def fake_post(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(llm._SESSION, "post", fake_post)
+    with pytest.raises(llm.OllamaUnavailableError):
+        llm._stream_analysis(llm.build_prompt("x"), "m", 0.0, False)
+
+
+@pytest.mark.parametrize("status, unavailable", [(503, True), (502, True), (400, False), (404, False)])
+def test_http_errors_raise_unavailable_only_for_server_overload(monkeypatch, status, unavailable):
+    monkeypatch.setattr(llm._SESSION, "post", lambda *a, **k: FakeStream([], status_code=status))
+    with pytest.raises(RuntimeError) as excinfo:
+        llm._stream_analysis(llm.build_prompt("x"), "m", 0.0, False)
+    assert isinstance(excinfo.value, llm.OllamaUnavailableError) == unavailable
+
+
+def test_bad_reply_is_not_reported_as_unavailable(monkeypatch):
+    monkeypatch.setattr(llm._SESSION, "post", lambda *a, **k: FakeStream(["no json here"]))
+    with pytest.raises(RuntimeError) as excinfo:
+        llm._stream_analysis(llm.build_prompt("x"), "m", 0.0, False)
+    assert not isinstance(excinfo.value, llm.OllamaUnavailableError)
+
+
+def test_first_chunk_gets_the_long_timeout_and_later_gaps_the_short_one(monkeypatch):
+    posted = {}
+    read_timeouts = []
+
+    def fake_post(url, **kwargs):
+        posted.update(kwargs)
+        return FakeStream(['{"impact_level": "Low"}'])
+
+    monkeypatch.setattr(llm._SESSION, "post", fake_post)
+    monkeypatch.setattr(llm, "_set_read_timeout", lambda r, seconds: read_timeouts.append(seconds))
+    llm._stream_analysis(llm.build_prompt("x"), "m", 0.0, False)
+    assert posted["timeout"] == (llm.OLLAMA_CONNECT_TIMEOUT, llm.OLLAMA_STREAM_TIMEOUT)
+    assert read_timeouts == [llm.OLLAMA_CALL_TIMEOUT]
+
+
+def test_prompts_are_not_resent_after_a_read_timeout():
+    retry = llm._SESSION.get_adapter(llm.OLLAMA_URL).max_retries
+    assert "POST" not in retry.allowed_methods
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        requests.ReadTimeout("first chunk"),
+        requests.ConnectionError(ReadTimeoutError(None, "/api/chat", "Read timed out.")),
+        TimeoutError("budget"),
+    ],
+    ids=["first-chunk", "mid-stream", "total-budget"],
+)
+def test_timeouts_raise_timeout_error_not_unavailable(monkeypatch, error):
+    def fake_post(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(llm._SESSION, "post", fake_post)
+    with pytest.raises(llm.OllamaTimeoutError):
+        llm._stream_analysis(llm.build_prompt("x"), "m", 0.0, False)
+
+
+def test_total_budget_overrun_raises_timeout_error(monkeypatch):
+    monkeypatch.setattr(llm._SESSION, "post", lambda *a, **k: FakeStream(['{"impact_level": ', '"High"}']))
+    monkeypatch.setattr(llm, "OLLAMA_TOTAL_BUDGET", -1)
+    with pytest.raises(llm.OllamaTimeoutError):
+        llm._stream_analysis(llm.build_prompt("x"), "m", 0.0, False)
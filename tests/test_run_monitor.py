@@ -0,0 +1,237 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import src.llm as llm
+import src.run_monitor as rm
+
+
+def make_item(acc, form="4", length=600, min_chars=300):
+    return {
+        "symbol": "TEST",
+        "cik": "1",
+        "filing": {"accession_number": acc, "form_type": form, "filing_date": "2024-01-01", "primary_doc_url": f"https://x/{acc}/d.htm"},
+        "text": f"{acc} ".ljust(length, "x"),
+        "form": form,
+        "min_chars": min_chars,
+    }
+
+
+def accessions(batches):
+    return [[item["filing"]["accession_number"] for item in batch] for batch in batches]
+
+
+@pytest.fixture(autouse=True)
+def batch_limits(monkeypatch):
+    monkeypatch.setattr(rm, "LLM_BATCH_SIZE", 3)
+    monkeypatch.setattr(rm, "LLM_BATCH_MAX_CHARS", 1000)
+
+
+def test_plan_batches_groups_short_filings_by_form():
+    items = [make_item("a", "4"), make_item("b", "8-K"), make_item("c", "4"), make_item("d", "8-K")]
+    assert accessions(rm.plan_batches(items)) == [["a", "c"], ["b", "d"]]
+
+
+def test_plan_batches_caps_batch_size():
+    items = [make_item(str(i)) for i in range(7)]
+    assert accessions(rm.plan_batches(items)) == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+
+
+def test_plan_batches_sends_long_filings_alone():
+    items = [make_item("short1"), make_item("long", length=1001), make_item("short2")]
+    assert accessions(rm.plan_batches(items)) == [["long"], ["short1", "short2"]]
+
+
+def test_plan_batches_sends_prefilter_rejects_alone():
+    items = [make_item("ok1"), make_item("tiny", length=10), make_item("ok2")]
+    assert accessions(rm.plan_batches(items)) == [["tiny"], ["ok1", "ok2"]]
+
+
+def test_plan_batches_disabled_with_batch_size_one(monkeypatch):
+    monkeypatch.setattr(rm, "LLM_BATCH_SIZE", 1)
+    items = [make_item("a"), make_item("b")]
+    assert accessions(rm.plan_batches(items)) == [["a"], ["b"]]
+
+
+@pytest.fixture
+def fresh_storage(fresh_storage, monkeypatch):
+    # run_monitor bound `storage` at import; point it at the fresh database too
+    monkeypatch.setattr(rm, "storage", fresh_storage)
+    return fresh_storage
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    """Record which analysis each filing ended up alerting with."""
+    sent = {}
+
+    def fake_format_alert(symbol, filing, analysis):
+        sent[filing["accession_number"]] = analysis["doc"]
+        return "subject", "body"
+
+    monkeypatch.setattr(rm, "should_alert", lambda analysis: True)
+    monkeypatch.setattr(rm, "format_alert", fake_format_alert)
+    monkeypatch.setattr(rm, "send_email", lambda subject, body: None)
+    return sent
+
+
+def fake_llm(monkeypatch, batch_reply):
+    """Answer single prompts with the accession the text starts with; batches with `batch_reply`.
+
+    An exception as `batch_reply` is raised for every call, batched or not.
+    """
+    calls = []
+
+    def fake_request(messages, model, temperature, array=False):
+        calls.append("batch" if array else "single")
+        if isinstance(batch_reply, Exception):
+            raise batch_reply
+        if array:
+            return batch_reply
+        return {"impact_level": "High", "doc": messages[-1]["content"].split()[0]}
+
+    monkeypatch.setattr(llm, "_request_analysis", fake_request)
+    return calls
+
+
+def test_process_batch_pairs_batched_analyses_in_order(monkeypatch, fresh_storage, alerts):
+    calls = fake_llm(monkeypatch, [{"impact_level": "High", "doc": d} for d in ("a", "b", "c")])
+    rows = rm.process_batch([make_item("a"), make_item("b"), make_item("c")])
+    assert calls == ["batch"]
+    assert alerts == {"a": "a", "b": "b", "c": "c"}
+    assert [row[0] for row in rows] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize(
+    "batch_reply",
+    [
+        [{"impact_level": "High", "doc": "a"}, {"impact_level": "High", "doc": "b"}],
+        [{"impact_level": "High", "doc": d} for d in ("a", "b", "c", "d")],
+        [{"impact_level": "High", "doc": "a"}, "not an object", {"impact_level": "High", "doc": "c"}],
+        {"impact_level": "High", "doc": "a"},
+    ],
+    ids=["too-short", "too-long", "bad-item", "not-a-list"],
+)
+def test_process_batch_falls_back_to_single_calls(monkeypatch, fresh_storage, alerts, batch_reply):
+    calls = fake_llm(monkeypatch, batch_reply)
+    rows = rm.process_batch([make_item("a"), make_item("b"), make_item("c")])
+    assert calls == ["batch", "single", "single", "single"]
+    assert alerts == {"a": "a", "b": "b", "c": "c"}
+    assert [row[0] for row in rows] == ["a", "b", "c"]
+
+
+def test_unavailable_llm_leaves_filing_unprocessed(monkeypatch, fresh_storage, alerts):
+    calls = fake_llm(monkeypatch, llm.OllamaUnavailableError("timed out"))
+    assert rm.process_filing(make_item("a")) is None
+    assert calls == ["single"]
+    assert alerts == {}
+
+
+def test_unavailable_llm_skips_whole_batch(monkeypatch, fresh_storage, alerts):
+    calls = fake_llm(monkeypatch, llm.OllamaUnavailableError("timed out"))
+    assert rm.process_batch([make_item("a"), make_item("b")]) == []
+    assert calls == ["batch"]
+
+
+def test_failed_analysis_is_still_marked_processed(monkeypatch, fresh_storage, alerts):
+    fake_llm(monkeypatch, RuntimeError("unparseable reply"))
+    assert rm.process_filing(make_item("a"))[0] == "a"
+
+
+def test_collect_filings_retries_older_unprocessed_filings(monkeypatch, fresh_storage):
+    filings = [make_item(acc)["filing"] for acc in ("new", "seen", "left-over")]
+    fresh_storage.mark_processed("seen", "1", "4", "2024-01-01")
+    monkeypatch.setattr(rm, "fetch_filings", lambda cik: filings)
+    monkeypatch.setattr(rm, "extract_texts", lambda urls, **kwargs: ["x" * 600 for _ in urls])
+    items = rm.collect_filings("TEST", {"cik": "1"})
+    assert [item["filing"]["accession_number"] for item in items] == ["new", "left-over"]
+
+
+@pytest.mark.parametrize("text", [None, "", "Access Denied"], ids=["too-short-to-parse", "empty", "block-page"])
+def test_prefilter_rejects_with_short_text_are_dumped(monkeypatch, fresh_storage, text):
+    dumped = []
+    monkeypatch.setattr(rm._DEBUG_WRITER, "submit", lambda fn, acc, url: dumped.append(acc))
+    item = make_item("a", form="10-K", min_chars=3000)
+    item["text"] = text
+    assert rm.process_filing(item)[0] == "a"
+    assert dumped == ["a"]
+
+
+def test_stop_request_skips_batches_not_yet_started(monkeypatch, fresh_storage, alerts):
+    stop = rm.threading.Event()
+    stop.set()
+    monkeypatch.setattr(rm, "_STOP", stop)
+    calls = fake_llm(monkeypatch, [])
+    assert rm.process_batch([make_item("a")]) == []
+    assert calls == []
+
+
+def test_run_cycle_processes_joint_filings_once(monkeypatch, fresh_storage, alerts):
+    other = make_item("shared")
+    other["symbol"] = "OTHER"
+    monkeypatch.setattr(rm, "_collect_all", lambda: [[make_item("shared"), make_item("own")], [other]])
+    calls = fake_llm(monkeypatch, [{"impact_level": "High", "doc": d} for d in ("shared", "own")])
+    rm.run_cycle()
+    assert calls == ["batch"]
+    assert alerts == {"shared": "shared", "own": "own"}
+    assert fresh_storage.is_processed("shared") and fresh_storage.is_processed("own")
+
+
+def test_concurrent_workers_send_one_alert_per_filing(monkeypatch, fresh_storage, alerts):
+    emails = []
+
+    def slow_send(subject, body):
+        time.sleep(0.05)
+        emails.append(subject)
+
+    monkeypatch.setattr(rm, "send_email", slow_send)
+    analysis = {"impact_level": "High", "doc": "a"}
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        list(ex.map(lambda _: rm.process_filing(make_item("a"), analysis), range(4)))
+    assert len(emails) == 1
+    assert fresh_storage.has_alert("a")
+
+
+def test_llm_timeouts_are_retried_up_to_the_attempt_limit(monkeypatch, fresh_storage, alerts):
+    monkeypatch.setattr(rm, "MAX_FILING_ATTEMPTS", 3)
+    calls = fake_llm(monkeypatch, llm.OllamaTimeoutError("too slow"))
+    results = [rm.process_filing(make_item("a")) for _ in range(3)]
+    assert results[:2] == [None, None]
+    assert results[2][0] == "a"
+    assert calls == ["single"] * 3
+
+
+def test_unavailable_llm_is_not_counted_as_an_attempt(monkeypatch, fresh_storage, alerts):
+    monkeypatch.setattr(rm, "MAX_FILING_ATTEMPTS", 1)
+    fake_llm(monkeypatch, llm.OllamaUnavailableError("refused"))
+    assert [rm.process_filing(make_item("a")) for _ in range(3)] == [None, None, None]
+
+
+def test_batch_timeout_falls_back_to_single_calls(monkeypatch, fresh_storage, alerts):
+    calls = []
+
+    def fake_request(messages, model, temperature, array=False):
+        calls.append("batch" if array else "single")
+        if array:
+            raise llm.OllamaTimeoutError("batch too slow")
+        return {"impact_level": "High", "doc": messages[-1]["content"].split()[0]}
+
+    monkeypatch.setattr(llm, "_request_analysis", fake_request)
+    rows = rm.process_batch([make_item("a"), make_item("b")])
+    assert calls == ["batch", "single", "single"]
+    assert [row[0] for row in rows] == ["a", "b"]
+
+
+def test_permanent_fetch_failures_are_recorded_after_the_attempt_limit(monkeypatch, fresh_storage):
+    monkeypatch.setattr(rm, "MAX_FILING_ATTEMPTS", 2)
+    filings = [make_item(acc)["filing"] for acc in ("missing", "offline")]
+    monkeypatch.setattr(rm, "fetch_filings", lambda cik: filings)
+    monkeypatch.setattr(
+        rm, "extract_texts", lambda urls, **kwargs: [ValueError("Document is empty"), requests.ConnectionError("down")]
+    )
+    for _ in range(2):
+        assert rm.collect_filings("TEST", {"cik": "1"}) == []
+    assert fresh_storage.is_processed("missing")
+    assert not fresh_storage.is_processed("offline")
@@ -0,0 +1,46 @@
+import pytest
+
+from src.storage import Storage
+
+
+@pytest.fixture
+def db(tmp_path):
+    storage = Storage(str(tmp_path / "db.sqlite"))
+    yield storage
+    storage.close()
+
+
+def test_transaction_commits_on_success(db):
+    with db.transaction():
+        db.put_filing_text("0001", "text")
+        db.mark_processed("0001", "1", "8-K", "2024-01-01")
+    reopened = Storage(db.db_path)
+    assert reopened.get_filing_text("0001") == "text"
+    assert reopened.is_processed("0001")
+    reopened.close()
+
+
+def test_transaction_rolls_back_on_error(db):
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.put_filing_text("0001", "text")
+            db.mark_processed("0001", "1", "8-K", "2024-01-01")
+            raise ValueError("boom")
+    assert db.conn.execute("SELECT COUNT(*) FROM filings_cache").fetchone()[0] == 0
+    assert db.conn.execute("SELECT COUNT(*) FROM processed_filings").fetchone()[0] == 0
+    assert not db.is_processed("0001")
+
+
+def test_nested_transaction_error_rolls_back_outer_block(db):
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.put_filing_text("0001", "outer")
+            with db.transaction():
+                db.put_filing_text("0002", "inner")
+                raise ValueError("boom")
+    assert db.conn.execute("SELECT COUNT(*) FROM filings_cache").fetchone()[0] == 0
+
+
+def test_record_failure_counts_attempts_per_filing(db):
+    assert [db.record_failure("0001", "timeout") for _ in range(3)] == [1, 2, 3]
+    assert db.record_failure("0002", "404") == 1